@@ -1,3 +1,3 @@
-from .graph import create_agent_graph, run_agent
+from .graph import create_agent_graph, run_agent, stream_agent, run_batch
 
-__all__ = ["create_agent_graph", "run_agent"]
+__all__ = ["create_agent_graph", "run_agent", "stream_agent", "run_batch"]
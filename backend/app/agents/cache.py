@@ -0,0 +1,218 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import asyncio
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, Optional, Tuple
+
+# Seconds an answer stays valid, per agent. 0 disables caching for that
+# agent, None caches until evicted. "router" caches the query classification.
+DEFAULT_TTLS: Dict[str, Optional[int]] = {
+    "router": 24 * 3600,
+    "general": 3600,
+    "coding": 3600,
+    "grammar": 24 * 3600,
+    "research": 3600,
+    "planning": 3600,
+    "creative": 0,          # temperature 0.9 - users expect a fresh answer
+    "math": None,           # deterministic enough to keep until evicted
+    "conversation": 300
+}
+
+CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")  # memory, sqlite or none
+CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000"))
+CACHE_SQLITE_PATH = os.getenv("RESPONSE_CACHE_PATH", "./response_cache.db")
+# SQLite backend: seconds between LRU timestamp writes for a hot entry, and sets between eviction passes
+CACHE_TOUCH_INTERVAL = float(os.getenv("RESPONSE_CACHE_TOUCH_INTERVAL", "60"))
+CACHE_EVICT_EVERY = int(os.getenv("RESPONSE_CACHE_EVICT_EVERY", "50"))
+
+
+def parse_ttls(spec: str) -> Dict[str, Optional[int]]:
+    """
+    Parse a TTL override such as "creative=0,math=-1,general=600".
+    A negative value means no expiry.
+    """
+    ttls = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        agent, _, seconds = item.partition("=")
+        value = int(seconds)
+        ttls[agent.strip()] = None if value < 0 else value
+    return ttls
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a query for exact-match lookups: case, whitespace and trailing punctuation."""
+    query = re.sub(r"\s+", " ", query.strip().lower())
+    return query.rstrip(" ?!.")
+
+
+class MemoryCacheBackend:
+    """In-process LRU store."""
+
+    # Cheap enough to call on the event loop
+    executor = None
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Tuple[Optional[float], Dict[str, Any]]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at < time.time():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Dict[str, Any], expires_at: Optional[float]) -> None:
+        self.entries[key] = (expires_at, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class SQLiteCacheBackend:
+    """
+    LRU store in a local SQLite file, shared across workers and restarts.
+
+    Calls block on disk, so ResponseCache runs them on this backend's own
+    thread. LRU order is approximate: a hit only rewrites accessed_at when
+    it is older than touch_interval, and eviction runs every evict_every sets.
+    """
+
+    def __init__(
+        self,
+        path: str = CACHE_SQLITE_PATH,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        touch_interval: float = CACHE_TOUCH_INTERVAL,
+        evict_every: int = CACHE_EVICT_EVERY
+    ):
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self.evict_every = evict_every
+        self.sets_since_evict = 0
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="response-cache")
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # With WAL, NORMAL only syncs at checkpoints; losing the last few cache writes on power loss is fine
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL, accessed_at REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_response_cache_accessed ON response_cache (accessed_at)"
+        )
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value, expires_at, accessed_at FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] is not None and row[1] < now:
+                self.conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                return None
+            if now - row[2] > self.touch_interval:
+                self.conn.execute("UPDATE response_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Dict[str, Any], expires_at: Optional[float]) -> None:
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires_at, time.time())
+            )
+            self.sets_since_evict += 1
+            if self.sets_since_evict < self.evict_every:
+                return
+            self.sets_since_evict = 0
+            self.conn.execute(
+                "DELETE FROM response_cache WHERE key IN ("
+                "SELECT key FROM response_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+
+
+class ResponseCache:
+    """
+    Exact-match cache of agent results keyed on (agent, normalized query),
+    with per-agent TTLs and hit/miss counters.
+    """
+
+    def __init__(self, backend, ttls: Optional[Dict[str, Optional[int]]] = None):
+        self.backend = backend
+        self.ttls = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+
+    def is_cacheable(self, agent: str) -> bool:
+        return self.backend is not None and self.ttls.get(agent, 0) != 0
+
+    async def call_backend(self, fn: Callable, *args) -> Any:
+        """Run a backend call, off the event loop if the backend blocks (see its executor)."""
+        if self.backend.executor is None:
+            return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.backend.executor, fn, *args)
+
+    async def get(self, agent: str, query: str) -> Optional[Dict[str, Any]]:
+        """Return the cached result for this agent and query, or None."""
+        if not self.is_cacheable(agent):
+            return None
+        value = await self.call_backend(self.backend.get, f"{agent}:{normalize_query(query)}")
+        if value is None:
+            self.misses[agent] += 1
+        else:
+            self.hits[agent] += 1
+        return value
+
+    async def set(self, agent: str, query: str, value: Dict[str, Any]) -> None:
+        """Store a result using the agent's TTL."""
+        if not self.is_cacheable(agent):
+            return
+        ttl = self.ttls[agent]
+        expires_at = time.time() + ttl if ttl is not None else None
+        await self.call_backend(self.backend.set, f"{agent}:{normalize_query(query)}", value, expires_at)
+
+    def get_stats(self) -> Dict[str, Any]:
+        agents = sorted(set(self.hits) | set(self.misses))
+        return {
+            "backend": CACHE_BACKEND,
+            "entries": len(self.backend) if self.backend is not None else 0,
+            "hits": sum(self.hits.values()),
+            "misses": sum(self.misses.values()),
+            "by_agent": {
+                agent: {"hits": self.hits[agent], "misses": self.misses[agent]}
+                for agent in agents
+            }
+        }
+
+
+def create_backend(name: str = CACHE_BACKEND):
+    """Build the configured cache backend ("memory", "sqlite" or "none")."""
+    if name == "sqlite":
+        return SQLiteCacheBackend()
+    if name == "none":
+        return None
+    return MemoryCacheBackend()
+
+
+response_cache = ResponseCache(create_backend(), parse_ttls(os.getenv("RESPONSE_CACHE_TTLS", "")))
@@ -0,0 +1,163 @@
+import os
+import re
+import logging
+from collections import Counter
+from typing import Dict, Any, List, Optional, Tuple, get_args
+
+from .state import QUERY_TYPES
+from app.services.telemetry import log_event
+
+# Optional dependency: without scikit-learn only the keyword rules are used
+try:
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+except ImportError:  # pragma: no cover - depends on the environment
+    make_pipeline = None
+
+VALID_TYPES = list(get_args(QUERY_TYPES))
+
+# Local predictions below this probability fall back to the LLM router
+CONFIDENCE_THRESHOLD = float(os.getenv("ROUTER_CONFIDENCE_THRESHOLD", "0.85"))
+# Don't train the model until we have this many labelled queries
+MIN_TRAINING_SAMPLES = int(os.getenv("ROUTER_MIN_TRAINING_SAMPLES", "200"))
+MAX_TRAINING_SAMPLES = int(os.getenv("ROUTER_MAX_TRAINING_SAMPLES", "20000"))
+
+# Deliberately conservative: a rule should only fire when the label is unambiguous
+RULES: List[Tuple[str, re.Pattern]] = [
+    ("conversation", re.compile(
+        r"^\s*(hi|hello|hey|hiya|yo|good (morning|afternoon|evening|night)|how are you( doing)?|"
+        r"what'?s up|thanks|thank you|bye|goodbye|see you)\b[\s\w]{0,12}[!.?]*\s*$",
+        re.IGNORECASE
+    )),
+    ("grammar", re.compile(
+        r"^\s*(please\s+)?(fix|correct|proofread|check)\s+(the\s+)?(grammar|spelling|this sentence|this text|this paragraph|my sentence)\b",
+        re.IGNORECASE
+    )),
+    ("math", re.compile(
+        r"^\s*(solve|calculate|compute|simplify|evaluate)\b:?(?=.*\d)(?=.*[=+*/^])(?!.*[a-z]{3})|"
+        r"^(?=.*\d)(?=.*[+\-*/^=])[\d\s.+\-*/^()=x]+\??$",
+        re.IGNORECASE
+    )),
+    ("creative", re.compile(
+        r"^\s*(please\s+)?(write|compose)\s+(me\s+)?(a|an)\s+(\w+\s+)?(poem|haiku|story|short story|song|limerick|sonnet)\b",
+        re.IGNORECASE
+    )),
+]
+
+# How many queries took each routing path: "rules", "model" or "llm"
+route_counts: Counter = Counter()
+
+
+class QueryClassifier:
+    """
+    Local query classifier: keyword rules first, then an optional
+    TF-IDF + logistic regression model trained on previously routed queries.
+    """
+
+    def __init__(self, threshold: float = CONFIDENCE_THRESHOLD):
+        self.threshold = threshold
+        self.model = None
+        self.training_samples = 0
+
+    def train(self, samples: List[Tuple[str, str]]) -> bool:
+        """
+        Fit the model on (query, query_type) pairs.
+
+        Returns:
+            True if a model was trained
+        """
+        samples = [(q, t) for q, t in samples if q and t in VALID_TYPES]
+        if make_pipeline is None or len(samples) < MIN_TRAINING_SAMPLES:
+            return False
+        if len({t for _, t in samples}) < 2:
+            return False
+
+        queries, labels = zip(*samples)
+        model = make_pipeline(
+            TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True, min_df=2),
+            LogisticRegression(max_iter=1000)
+        )
+        model.fit(queries, labels)
+
+        self.model = model
+        self.training_samples = len(samples)
+        return True
+
+    def classify(self, query: str) -> Optional[Tuple[str, float, str]]:
+        """
+        Classify a query locally.
+
+        Returns:
+            (query_type, confidence, source) if confident enough, otherwise None
+        """
+        for query_type, pattern in RULES:
+            if pattern.search(query):
+                return query_type, 1.0, "rules"
+
+        if self.model is not None:
+            probabilities = self.model.predict_proba([query])[0]
+            best = probabilities.argmax()
+            confidence = float(probabilities[best])
+            if confidence >= self.threshold:
+                return str(self.model.classes_[best]), confidence, "model"
+
+        return None
+
+
+classifier = QueryClassifier()
+
+
+def classify_query(query: str) -> Optional[Tuple[str, float, str]]:
+    """Classify a query with the shared local classifier (see QueryClassifier.classify)."""
+    return classifier.classify(query)
+
+
+def record_route(source: str) -> None:
+    """Count which path ("rules", "model", "llm" or "llm_batch") classified a query."""
+    route_counts[source] += 1
+
+
+def load_training_samples(db) -> List[Tuple[str, str]]:
+    """
+    Pair each stored user message with the query_type of the assistant reply that follows it.
+    """
+    from app.models import ChatMessage
+
+    rows = db.query(
+        ChatMessage.session_id, ChatMessage.role, ChatMessage.content, ChatMessage.query_type
+    ).order_by(
+        ChatMessage.created_at.desc()
+    ).limit(MAX_TRAINING_SAMPLES * 2).all()
+
+    samples = []
+    pending = {}  # session_id -> query_type of the assistant reply awaiting its question
+    for session_id, role, content, query_type in rows:
+        if role == "assistant":
+            pending[session_id] = query_type
+        elif role == "user" and pending.get(session_id):
+            samples.append((content, pending.pop(session_id)))
+    return samples
+
+
+def train_from_db(db) -> bool:
+    """Train the shared classifier on labels already stored in chat_messages.query_type."""
+    try:
+        trained = classifier.train(load_training_samples(db))
+    except Exception as e:
+        log_event("classifier_training_error", logging.ERROR, error=str(e))
+        return False
+
+    if trained:
+        log_event("classifier_trained", samples=classifier.training_samples)
+    return trained
+
+
+def get_stats() -> Dict[str, Any]:
+    """Routing path counts and classifier status."""
+    return {
+        "paths": {source: route_counts.get(source, 0) for source in ("rules", "model", "llm", "llm_batch")},
+        "model_trained": classifier.model is not None,
+        "training_samples": classifier.training_samples,
+        "confidence_threshold": classifier.threshold
+    }
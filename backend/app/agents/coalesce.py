@@ -0,0 +1,131 @@
+import os
+import asyncio
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .nodes import event_sink
+from .prompts import PROMPTS
+from .cache import normalize_query
+from app.services.llm_gateway import PRIORITY_NAMES, llm_priority
+from app.services.telemetry import Counter as MetricCounter, register_metric
+
+COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "true").lower() == "true"
+# Agents answering above this temperature are expected to vary, so each request gets its own answer
+COALESCE_MAX_TEMPERATURE = float(os.getenv("COALESCE_MAX_TEMPERATURE", "0.7"))
+# Requests that may join one in-flight query; more run on their own
+COALESCE_MAX_WAITERS = int(os.getenv("COALESCE_MAX_WAITERS", "100"))
+
+COALESCED_CALLS = MetricCounter(
+    "voxai_coalesced_calls_total", "Agent runs saved by joining an identical in-flight query", ("agent",)
+)
+register_metric(COALESCED_CALLS)
+
+
+class Flight:
+    """
+    One in-flight agent run shared by every request that asked the same thing.
+
+    Installed as the run's event sink: events ("route", "token") are kept
+    for late joiners and forwarded to each participant's own stream.
+    """
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.events: List[Tuple[str, Dict[str, Any]]] = []
+        self.sinks: List[asyncio.Queue] = []
+        self.waiters = 0
+
+    def is_joinable(self) -> bool:
+        """False once the run has finished or is being cancelled."""
+        return not self.task.done() and not self.task.cancelling()
+
+    def put_nowait(self, item: Tuple[str, Dict[str, Any]]) -> None:
+        self.events.append(item)
+        for sink in self.sinks:
+            sink.put_nowait(item)
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent agent runs keyed on (agent, temperature,
+    LLM priority, normalized query): the first request starts the run, later
+    ones wait for its result and receive its token stream instead of calling
+    the LLM again. The run's LLM calls inherit the first request's priority,
+    so interactive requests never join a background (batch) run.
+
+    The run is a task of its own, so it survives any one participant
+    disconnecting; it is cancelled only when nobody is waiting for it.
+    """
+
+    def __init__(self, max_waiters: int = COALESCE_MAX_WAITERS):
+        self.max_waiters = max_waiters
+        self.flights: Dict[str, Flight] = {}
+        self.started: Counter = Counter()
+        self.coalesced: Counter = Counter()
+
+    def is_coalescable(self, agent: str) -> bool:
+        return COALESCE_ENABLED and agent in PROMPTS and PROMPTS[agent].temperature <= COALESCE_MAX_TEMPERATURE
+
+    def key(self, agent: str, query: str) -> str:
+        priority = PRIORITY_NAMES[llm_priority.get()]
+        return f"{agent}:{PROMPTS[agent].temperature}:{priority}:{normalize_query(query)}"
+
+    async def run(self, agent: str, query: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Return fn()'s result, sharing the call with identical in-flight queries."""
+        key = self.key(agent, query)
+        flight = self.flights.get(key)
+        if flight is not None and not flight.is_joinable():
+            # A run that is ending would hand its result (or CancelledError) to a new waiter
+            self.forget(key, flight)
+            flight = None
+        if flight is not None and flight.waiters >= self.max_waiters:
+            return await fn()
+
+        if flight is None:
+            flight = self.flights[key] = Flight()
+            sink_token = event_sink.set(flight)
+            try:
+                flight.task = asyncio.create_task(fn())
+            finally:
+                event_sink.reset(sink_token)
+            flight.task.add_done_callback(lambda _: self.forget(key, flight))
+            self.started[agent] += 1
+        else:
+            self.coalesced[agent] += 1
+            COALESCED_CALLS.inc(1, agent)
+
+        sink = event_sink.get()
+        if sink is not None:
+            for item in flight.events:
+                sink.put_nowait(item)
+            flight.sinks.append(sink)
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if sink is not None:
+                flight.sinks.remove(sink)
+            if flight.waiters == 0 and not flight.task.done():
+                # Unlisted first, so an identical query arriving now starts a fresh run
+                self.forget(key, flight)
+                flight.task.cancel()
+
+    def forget(self, key: str, flight: Flight) -> None:
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        agents = sorted(set(self.started) | set(self.coalesced))
+        return {
+            "enabled": COALESCE_ENABLED,
+            "in_flight": len(self.flights),
+            "saved_calls": sum(self.coalesced.values()),
+            "by_agent": {
+                agent: {"runs": self.started[agent], "coalesced": self.coalesced[agent]}
+                for agent in agents
+            }
+        }
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,162 @@
+import os
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from .prompts import PROMPTS
+from app.services.llm_gateway import BACKGROUND, LLMError
+from app.services.telemetry import log_event, current_agent
+
+# Tokens of conversation history sent with each request (recent turns only)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+# Sessions whose rolling summary is kept in memory
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "1000"))
+
+# Per-message framing tokens added by the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encoding = None
+
+
+def get_encoding():
+    """Load the gpt-4o tokenizer once; None if tiktoken or its data isn't available."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            log_event("tokenizer_unavailable", logging.WARNING, error=str(e), fallback="approximate counts")
+            _encoding = False
+    return _encoding or None
+
+
+async def warm_up_tokenizer() -> None:
+    """
+    Load the tokenizer at startup on a worker thread: the first load may
+    download and parse its BPE file, which would otherwise stall the event
+    loop inside the first request with history. A fallback is logged here, once.
+    """
+    await asyncio.to_thread(get_encoding)
+
+
+def count_tokens(text: str) -> int:
+    """Count the tokens a message's content will use."""
+    encoding = get_encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+class SummaryCache:
+    """
+    Rolling summaries of the older part of each session, LRU-bounded.
+
+    Each entry remembers the id of the last message folded into the summary,
+    so updates only summarize messages that have newly left the context window.
+    """
+
+    def __init__(self, max_sessions: int = SUMMARY_CACHE_SIZE):
+        self.max_sessions = max_sessions
+        self.entries: "OrderedDict[str, Tuple[str, Optional[str]]]" = OrderedDict()
+        self.updating: set = set()
+        self.tasks: set = set()
+
+    def get(self, session_id: str) -> Tuple[Optional[str], Optional[str]]:
+        """(summary, id of the last summarized message) for a session."""
+        entry = self.entries.get(session_id)
+        if entry is None:
+            return None, None
+        self.entries.move_to_end(session_id)
+        return entry
+
+    def set(self, session_id: str, summary: str, last_id: Optional[str]) -> None:
+        self.entries[session_id] = (summary, last_id)
+        self.entries.move_to_end(session_id)
+        while len(self.entries) > self.max_sessions:
+            self.entries.popitem(last=False)
+
+    def schedule_update(self, session_id: str, older: List[dict]) -> None:
+        """Fold newly dropped messages into the summary in the background."""
+        if session_id in self.updating:
+            return
+        self.updating.add(session_id)
+        task = asyncio.create_task(self.update(session_id, older))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def update(self, session_id: str, older: List[dict]) -> None:
+        from .nodes import call_llm
+
+        current_agent.set("summary")
+        try:
+            summary, last_id = self.get(session_id)
+            new_messages = unsummarized(older, last_id)
+            if not new_messages:
+                return
+
+            transcript = "\n".join(f"{m['role']}: {m['content']}" for m in new_messages)
+            updated = await call_llm(
+                PROMPTS["summary"],
+                f"Existing summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}",
+                priority=BACKGROUND
+            )
+            self.set(session_id, updated.strip(), new_messages[-1].get("id"))
+        except LLMError as e:
+            # The next request that needs the summary schedules another attempt
+            log_event("summary_error", logging.WARNING, session_id=session_id, kind=e.kind, error=str(e))
+        finally:
+            self.updating.discard(session_id)
+
+
+def unsummarized(older: List[dict], last_id: Optional[str]) -> List[dict]:
+    """Messages in `older` after the last one already folded into the summary."""
+    if last_id is None:
+        return older
+    for i, message in enumerate(older):
+        if message.get("id") == last_id:
+            return older[i + 1:]
+    # The summarized message is older than anything loaded, so all of these are new
+    return older
+
+
+summaries = SummaryCache()
+
+
+def build_context(
+    history: List[dict],
+    session_id: Optional[str] = None,
+    budget: int = CONTEXT_TOKEN_BUDGET
+) -> List[dict]:
+    """
+    Select the conversation context to send with a query.
+
+    Keeps the most recent messages that fit in `budget` tokens. Older
+    messages are represented by a cached rolling summary of the session,
+    which is refreshed in the background when more turns fall out of the
+    window, so requests never wait on summarization.
+
+    Returns:
+        Chat messages ({"role", "content"}), oldest first
+    """
+    recent: List[Dict[str, str]] = []
+    used = 0
+    for message in reversed(history):
+        cost = count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+        if used + cost > budget:
+            break
+        recent.append({"role": message["role"], "content": message["content"]})
+        used += cost
+    recent.reverse()
+
+    older = history[:len(history) - len(recent)]
+    if not older or not session_id:
+        return recent
+
+    summary, last_id = summaries.get(session_id)
+    if unsummarized(older, last_id):
+        summaries.schedule_update(session_id, older)
+    if summary:
+        recent.insert(0, {"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+    return recent
@@ -1,9 +1,13 @@
-from typing import Dict, Any
+import os
+import asyncio
+import logging
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
 from langgraph.graph import StateGraph, END
 
 from .state import AgentState
 from .nodes import (
     router_agent,
+    llm_classify_batch,
     general_agent,
     coding_agent,
     grammar_agent,
@@ -12,8 +16,20 @@ from .nodes import (
     creative_agent,
     math_agent,
     conversation_agent,
-    response_enhancer
+    response_enhancer,
+    event_sink,
+    emit_event
 )
+from .cache import response_cache
+from .classifier import classify_query, record_route
+from .coalesce import single_flight
+from .context import build_context
+from app.services.llm_gateway import BACKGROUND, LLMError, llm_priority
+from app.services.telemetry import log_event, span, current_agent
+
+# Batch jobs (run_batch): queries answered at once, and queries routed per LLM call
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_ROUTER_CHUNK = int(os.getenv("BATCH_ROUTER_CHUNK", "40"))
 
 
 def route_to_agent(state: AgentState) -> str:
@@ -36,6 +52,108 @@ def route_to_agent(state: AgentState) -> str:
     return routing_map.get(agent_type, "general_agent")
 
 
+# State fields restored from the response cache for each kind of node
+CACHED_FIELDS = {
+    "router": ("query_type", "selected_agent")
+}
+SPECIALIST_CACHED_FIELDS = ("response", "plan")
+
+
+def with_response_cache(agent: str, node):
+    """
+    Wrap a node so repeated queries are answered from the response cache.
+
+    Only stand-alone queries are cached: with conversation history the same
+    text can mean something different.
+    """
+    fields = CACHED_FIELDS.get(agent, SPECIALIST_CACHED_FIELDS)
+
+    async def cached_node(state: AgentState) -> AgentState:
+        if state.get("history") or not response_cache.is_cacheable(agent):
+            return await node(state)
+
+        cached = await response_cache.get(agent, state["query"])
+        if cached is not None:
+            state.update(cached)
+            if agent == "router":
+                emit_event("route", {"query_type": state["query_type"], "agent_used": state["selected_agent"]})
+            else:
+                emit_event("token", {"text": state["response"]})
+            return state
+
+        state = await node(state)
+        # A failed call or a router fallback is a guess, not an answer worth keeping
+        if not state.get("error") and not state.get("route_fallback"):
+            await response_cache.set(agent, state["query"], {field: state.get(field) for field in fields})
+        return state
+
+    return cached_node
+
+
+def with_single_flight(agent: str, node):
+    """
+    Wrap a node so identical stand-alone queries running at the same time
+    share one run (and its token stream) instead of each calling the LLM.
+    """
+    async def coalesced_node(state: AgentState) -> AgentState:
+        if state.get("history") or not single_flight.is_coalescable(agent):
+            return await node(state)
+
+        started = []
+
+        def run():
+            # The shared run works on its own copy of the state
+            started.append(True)
+            return node(dict(state))
+
+        result = await single_flight.run(agent, state["query"], run)
+        if result.get("route_fallback") and not started:
+            # The shared run fell back to a guess; route this request on its own
+            return await node(state)
+        state.update(result)
+        return state
+
+    return coalesced_node
+
+
+def with_llm_errors(node):
+    """
+    Record a failed LLM call in the state (error, error_kind) instead of
+    failing the graph, so response_enhancer can answer appropriately.
+    """
+    async def guarded_node(state: AgentState) -> AgentState:
+        try:
+            return await node(state)
+        except LLMError as e:
+            log_event("agent_llm_error", logging.WARNING, agent=current_agent.get(), kind=e.kind, error=str(e))
+            state["error"] = str(e)
+            state["error_kind"] = e.kind
+            return state
+
+    return guarded_node
+
+
+def traced(stage: str, agent: str, node):
+    """
+    Time a node as `stage` in the request trace ("router", "specialist" or
+    "enhancer") and label the LLM calls it makes with `agent`.
+    """
+    async def traced_node(state: AgentState) -> AgentState:
+        agent_token = current_agent.set(agent)
+        try:
+            with span(stage):
+                return await node(state)
+        finally:
+            current_agent.reset(agent_token)
+
+    return traced_node
+
+
+def specialist_node(agent: str, node):
+    """A specialist with its tracing, error handling, response cache and coalescing."""
+    return traced("specialist", agent, with_llm_errors(with_response_cache(agent, with_single_flight(agent, node))))
+
+
 def create_agent_graph() -> StateGraph:
     """
     Creates the multi-agent graph using LangGraph.
@@ -46,17 +164,18 @@ def create_agent_graph() -> StateGraph:
     # Create the graph with our state schema
     workflow = StateGraph(AgentState)
 
-    # Add all nodes
-    workflow.add_node("router", router_agent)
-    workflow.add_node("general_agent", general_agent)
-    workflow.add_node("coding_agent", coding_agent)
-    workflow.add_node("grammar_agent", grammar_agent)
-    workflow.add_node("research_agent", research_agent)
-    workflow.add_node("planner_agent", planner_agent)
-    workflow.add_node("creative_agent", creative_agent)
-    workflow.add_node("math_agent", math_agent)
-    workflow.add_node("conversation_agent", conversation_agent)
-    workflow.add_node("enhancer", response_enhancer)
+    # Add all nodes (wrapped with the response cache and in-flight coalescing, keyed by
+    # query type; see specialist_node)
+    workflow.add_node("router", traced("router", "router", with_response_cache("router", with_single_flight("router", router_agent))))
+    workflow.add_node("general_agent", specialist_node("general", general_agent))
+    workflow.add_node("coding_agent", specialist_node("coding", coding_agent))
+    workflow.add_node("grammar_agent", specialist_node("grammar", grammar_agent))
+    workflow.add_node("research_agent", specialist_node("research", research_agent))
+    workflow.add_node("planner_agent", specialist_node("planning", planner_agent))
+    workflow.add_node("creative_agent", specialist_node("creative", creative_agent))
+    workflow.add_node("math_agent", specialist_node("math", math_agent))
+    workflow.add_node("conversation_agent", specialist_node("conversation", conversation_agent))
+    workflow.add_node("enhancer", traced("enhancer", "enhancer", response_enhancer))
 
     # Set entry point
     workflow.set_entry_point("router")
@@ -106,38 +225,47 @@ def get_agent_graph():
     return _agent_graph
 
 
-def run_agent(query: str, history: list = None) -> Dict[str, Any]:
+async def run_agent(
+    query: str,
+    history: list = None,
+    session_id: Optional[str] = None,
+    query_type: Optional[str] = None
+) -> Dict[str, Any]:
     """
-    Run the multi-agent system on a query.
+    Run the multi-agent system on a query without blocking the event loop.
 
     Args:
         query: The user's question/request
-        history: Optional conversation history
+        history: Optional conversation history, oldest first
+        session_id: Session the history belongs to, used to cache its rolling summary
+        query_type: Classification made beforehand (see run_batch); skips the router
 
     Returns:
         Dict containing the response and metadata
     """
-    if history is None:
-        history = []
+    # Only the recent turns that fit the token budget are sent; older ones are summarized
+    history = build_context(history or [], session_id)
 
     # Initialize the state
     initial_state: AgentState = {
         "query": query,
-        "query_type": None,
+        "query_type": query_type,
         "selected_agent": None,
         "plan": None,
         "research_context": None,
         "refined_query": None,
         "response": None,
         "history": history,
-        "error": None
+        "error": None,
+        "error_kind": None,
+        "route_fallback": False
     }
 
     # Get the graph and run it
     graph = get_agent_graph()
 
     try:
-        final_state = graph.invoke(initial_state)
+        final_state = await graph.ainvoke(initial_state)
 
         return {
             "response": final_state.get("response", "No response generated"),
@@ -155,3 +283,106 @@ def run_agent(query: str, history: list = None) -> Dict[str, Any]:
             "success": False,
             "error": str(e)
         }
+
+
+async def stream_agent(
+    query: str,
+    history: list = None,
+    session_id: Optional[str] = None
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Run the multi-agent system and yield its progress as (event, data) tuples.
+
+    Yields a "route" event once the router has classified the query, "token"
+    events while the specialist's answer streams in, and finally a "result"
+    event carrying the same dict that `run_agent` returns.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    # The task copies the current context, so nodes inside it see the queue
+    sink_token = event_sink.set(queue)
+    try:
+        task = asyncio.create_task(run_agent(query, history, session_id))
+    finally:
+        event_sink.reset(sink_token)
+    task.add_done_callback(lambda _: queue.put_nowait(None))
+
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            yield item
+        yield "result", task.result()
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+async def classify_batch(queries: List[str], chunk_size: int = BATCH_ROUTER_CHUNK) -> List[Optional[str]]:
+    """
+    Route many stand-alone queries at once: the local classifier takes what
+    it can, the rest are classified chunk_size at a time in one LLM call each.
+    Queries whose chunk failed are None and go through the router one by one.
+    """
+    query_types: List[Optional[str]] = [None] * len(queries)
+    pending = []
+    for i, query in enumerate(queries):
+        local = classify_query(query)
+        if local:
+            query_types[i] = local[0]
+            record_route(local[2])
+        else:
+            pending.append(i)
+
+    chunks = [pending[start:start + chunk_size] for start in range(0, len(pending), chunk_size)]
+    agent_token = current_agent.set("router")
+    try:
+        results = await asyncio.gather(*[
+            llm_classify_batch([queries[i] for i in chunk]) for chunk in chunks
+        ])
+    finally:
+        current_agent.reset(agent_token)
+    for chunk, chunk_types in zip(chunks, results):
+        for i, query_type in zip(chunk, chunk_types):
+            if query_type is not None:
+                query_types[i] = query_type
+                record_route("llm_batch")
+    return query_types
+
+
+async def run_batch(
+    queries: List[str],
+    concurrency: int = BATCH_CONCURRENCY
+) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Run many independent queries through the agent graph.
+
+    Queries are routed together (see classify_batch), then answered with at
+    most `concurrency` in flight. Their LLM calls run at BACKGROUND priority
+    so a batch job never crowds out interactive users.
+
+    Yields:
+        (index, result) as each query completes, where result is what
+        `run_agent` returns for queries[index]
+    """
+    priority_token = llm_priority.set(BACKGROUND)
+    try:
+        query_types = await classify_batch(queries)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def answer(index: int) -> Tuple[int, Dict[str, Any]]:
+            async with semaphore:
+                return index, await run_agent(queries[index], query_type=query_types[index])
+
+        # Tasks inherit the BACKGROUND priority from this context
+        tasks = [asyncio.create_task(answer(i)) for i in range(len(queries))]
+    finally:
+        llm_priority.reset(priority_token)
+
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
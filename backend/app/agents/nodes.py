@@ -1,279 +1,349 @@
 import os
-from typing import Dict, Any
-from openai import OpenAI
+import re
+import asyncio
+import logging
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional
 from .state import AgentState
+from .classifier import classify_query, record_route
+from .prompts import PROMPTS, Prompt, RESEARCH_MAX_SUBQUESTIONS
+from app.services.llm_gateway import LLMError, complete
+from app.services.telemetry import log_event
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Answer research queries as parallel sub-questions instead of one long answer
+RESEARCH_FANOUT = os.getenv("RESEARCH_FANOUT", "false").lower() == "true"
 
+# Queue receiving (event, data) tuples while an answer is being streamed.
+# Set by graph.stream_agent for the duration of a single request.
+event_sink: ContextVar[Optional[asyncio.Queue]] = ContextVar("event_sink", default=None)
 
-def call_llm(system_prompt: str, user_message: str, model: str = "gpt-4o-mini", temperature: float = 0.7) -> str:
-    """Helper function to call OpenAI API."""
+
+def emit_event(event: str, data: Dict[str, Any]) -> None:
+    """Publish an event to the current request's stream, if one is listening."""
+    sink = event_sink.get()
+    if sink is not None:
+        sink.put_nowait((event, data))
+
+
+async def call_llm(
+    prompt: Prompt,
+    user_message: str,
+    stream: bool = False,
+    history: Optional[List[dict]] = None,
+    priority: Optional[int] = None
+) -> str:
+    """
+    Call the LLM through the shared gateway (pooled client, deadline, retries)
+    with a prompt from the registry (see prompts.PROMPTS) and its model,
+    temperature and max_tokens.
+
+    Messages go from most to least stable: the static system prompt, then
+    `history` (the conversation context, see context.build_context), then the
+    user's message, so consecutive calls share the longest possible prefix
+    for the provider's prompt cache.
+
+    `priority` overrides the llm_priority context: BACKGROUND for calls
+    nobody is waiting on, so they yield to user queries.
+
+    When `stream` is set and a client is listening (see `event_sink`), the
+    completion is requested with OpenAI's streaming API and each token is
+    emitted as a "token" event as soon as it arrives.
+
+    Raises:
+        LLMError: if the call failed; specialist nodes turn it into state["error"]
+    """
+    messages = [
+        {"role": "system", "content": prompt.system},
+        *(history or []),
+        {"role": "user", "content": user_message}
+    ]
+    on_token = None
+    if stream and event_sink.get() is not None:
+        def on_token(delta: str) -> None:
+            emit_event("token", {"text": delta})
+
+    completion = await complete(
+        messages,
+        model=prompt.model,
+        temperature=prompt.temperature,
+        max_tokens=prompt.max_tokens,
+        on_token=on_token,
+        priority=priority
+    )
+    return completion.text
+
+
+async def gather_llm(*calls):
+    """
+    asyncio.gather for concurrent LLM calls: if one fails, the others are
+    cancelled instead of holding scheduler slots and spending tokens on an
+    answer nobody will use. The first error is re-raised as is (an LLMError
+    for with_llm_errors to handle).
+    """
+    tasks = [asyncio.ensure_future(call) for call in calls]
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message}
-            ],
-            temperature=temperature
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"Error: {str(e)}"
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
 
 
 # ============== ROUTER/DECISION AGENT ==============
-def router_agent(state: AgentState) -> AgentState:
+VALID_QUERY_TYPES = ["general", "coding", "grammar", "research", "planning", "creative", "math", "conversation"]
+
+
+async def router_agent(state: AgentState) -> AgentState:
     """
     Decision Agent: Analyzes the query and determines which specialized agent should handle it.
+
+    Confidently classified queries are answered by the local classifier; only
+    the rest pay for an LLM round trip.
     """
-    system_prompt = """You are a query classifier. Analyze the user's query and classify it into exactly ONE of these categories:
+    if state.get("query_type"):
+        # Classified up front, e.g. by run_batch
+        query_type = state["query_type"]
+        state["selected_agent"] = query_type
+        emit_event("route", {"query_type": query_type, "agent_used": query_type})
+        return state
+
+    local = classify_query(state["query"])
+    if local:
+        query_type, _, source = local
+    else:
+        query_type = await llm_classify(state["query"], state["history"][-2:])
+        source = "llm"
+        if query_type is None:
+            # Routing is best effort: the general agent can answer anything. The guess
+            # is flagged so it isn't cached or shared (see graph.with_response_cache)
+            query_type = "general"
+            state["route_fallback"] = True
+    record_route(source)
+
+    state["query_type"] = query_type
+    state["selected_agent"] = query_type
+    emit_event("route", {"query_type": query_type, "agent_used": query_type})
+
+    return state
 
-- general: General knowledge questions, facts, explanations
-- coding: Programming, code writing, debugging, technical implementation
-- grammar: Grammar correction, sentence improvement, rephrasing
-- research: Questions requiring deep analysis, comparisons, or detailed research
-- planning: Complex tasks needing step-by-step breakdown or project planning
-- creative: Creative writing, storytelling, content generation
-- math: Mathematical problems, calculations, equations
-- conversation: Casual chat, greetings, small talk
 
-Respond with ONLY the category name, nothing else."""
+async def llm_classify(query: str, history: Optional[List[dict]] = None) -> Optional[str]:
+    """
+    Classify a query with one LLM call (the "router" prompt).
+    The last exchange is included so follow-ups ("and in Python?") route like the question they follow.
 
-    query_type = call_llm(system_prompt, state["query"], temperature=0).strip().lower()
+    Returns:
+        The query type ("general" for an unrecognized reply), or None if the LLM call failed
+    """
+    try:
+        query_type = (await call_llm(PROMPTS["router"], query, history=history)).strip().lower()
+    except LLMError as e:
+        log_event("router_llm_error", logging.WARNING, kind=e.kind, error=str(e))
+        return None
 
     # Validate the response
-    valid_types = ["general", "coding", "grammar", "research", "planning", "creative", "math", "conversation"]
-    if query_type not in valid_types:
+    if query_type not in VALID_QUERY_TYPES:
         query_type = "general"
 
-    state["query_type"] = query_type
-    state["selected_agent"] = query_type
+    return query_type
 
-    return state
+
+async def llm_classify_batch(queries: List[str]) -> List[Optional[str]]:
+    """
+    Classify many stand-alone queries with a single LLM call (the "router_batch" prompt).
+    Queries missing from or garbled in the reply are classified as "general"; if
+    the call fails every entry is None, leaving those queries to the router.
+    """
+    numbered = "\n".join(f"{i}. {' '.join(query.split())}" for i, query in enumerate(queries, 1))
+    try:
+        reply = await call_llm(PROMPTS["router_batch"], numbered)
+    except LLMError as e:
+        log_event("router_llm_error", logging.WARNING, kind=e.kind, error=str(e), batch=len(queries))
+        return [None] * len(queries)
+
+    query_types = ["general"] * len(queries)
+
+    for match in re.finditer(r"^\s*(\d+)\s*[:.)-]\s*([a-z]+)", reply.lower(), re.MULTILINE):
+        index, query_type = int(match.group(1)) - 1, match.group(2)
+        if 0 <= index < len(queries) and query_type in VALID_QUERY_TYPES:
+            query_types[index] = query_type
+    return query_types
 
 
 # ============== GENERAL QA AGENT ==============
-def general_agent(state: AgentState) -> AgentState:
+async def general_agent(state: AgentState) -> AgentState:
     """
     General Agent: Handles general knowledge questions and explanations.
     """
-    system_prompt = """You are a knowledgeable assistant. Provide clear, accurate, and helpful answers to questions.
-Be concise but comprehensive. Use examples when helpful.
-If you're not sure about something, say so."""
-
     context = state.get("research_context", "")
     query = state["query"]
 
     if context:
         query = f"Context: {context}\n\nQuestion: {query}"
 
-    response = call_llm(system_prompt, query)
+    response = await call_llm(PROMPTS["general"], query, history=state["history"], stream=True)
     state["response"] = response
 
     return state
 
 
 # ============== CODING AGENT ==============
-def coding_agent(state: AgentState) -> AgentState:
+async def coding_agent(state: AgentState) -> AgentState:
     """
     Coding Agent: Handles programming and code-related questions.
     """
-    system_prompt = """You are an expert programmer and software engineer. Help with:
-- Writing clean, efficient code
-- Debugging and fixing issues
-- Explaining programming concepts
-- Code reviews and improvements
-- Best practices and design patterns
-
-When providing code:
-1. Use proper formatting with code blocks
-2. Add helpful comments
-3. Explain the logic
-4. Consider edge cases
-5. Follow best practices for the language"""
-
-    response = call_llm(system_prompt, state["query"])
+    response = await call_llm(PROMPTS["coding"], state["query"], history=state["history"], stream=True)
     state["response"] = response
 
     return state
 
 
 # ============== GRAMMAR AGENT ==============
-def grammar_agent(state: AgentState) -> AgentState:
+async def grammar_agent(state: AgentState) -> AgentState:
     """
     Grammar Agent: Handles grammar correction and sentence improvement.
     """
-    system_prompt = """You are an expert editor and grammar specialist. Your tasks:
-1. Correct any grammatical errors
-2. Improve sentence structure and clarity
-3. Enhance word choice while maintaining the original meaning
-4. Make the text more professional/natural as appropriate
-
-Format your response as:
-**Corrected:** [The corrected text]
-
-**Changes made:**
-- [List each change and why]
-
-If the text is already correct, say so and optionally suggest stylistic improvements."""
-
-    response = call_llm(system_prompt, state["query"])
+    response = await call_llm(PROMPTS["grammar"], state["query"], history=state["history"], stream=True)
     state["response"] = response
 
     return state
 
 
 # ============== RESEARCH AGENT ==============
-def research_agent(state: AgentState) -> AgentState:
+async def research_agent(state: AgentState) -> AgentState:
     """
     Research Agent: Handles questions requiring deep analysis and research.
-    """
-    system_prompt = """You are a thorough researcher and analyst. For research questions:
-
-1. Break down the topic into key aspects
-2. Provide comprehensive analysis
-3. Consider multiple perspectives
-4. Cite general knowledge and reasoning
-5. Identify areas of uncertainty
-6. Summarize key findings
 
-Structure your response clearly with headings if the topic is complex."""
+    With RESEARCH_FANOUT enabled, the analysis step produces sub-questions that
+    are answered in parallel and merged, instead of one long dependent answer.
+    """
+    if RESEARCH_FANOUT:
+        response = await research_fanout(state)
+        if response:
+            state["response"] = response
+            return state
 
     # First, gather context through analysis
-    analysis_prompt = """Analyze this query and identify:
-1. Key concepts to explore
-2. Important aspects to cover
-3. Potential sub-questions to answer
-
-Query: """ + state["query"]
-
-    context = call_llm(
-        "You are a research assistant. Identify key aspects to research.",
-        analysis_prompt,
-        temperature=0.3
-    )
+    context = await call_llm(PROMPTS["research_analysis"], state["query"])
     state["research_context"] = context
 
     # Then provide comprehensive response
     full_query = f"""Research context and aspects to cover:
 {context}
 
-User's question: {state["query"]}
+User's question: {state["query"]}"""
 
-Provide a comprehensive, well-researched response."""
-
-    response = call_llm(system_prompt, full_query)
+    response = await call_llm(PROMPTS["research"], full_query, history=state["history"], stream=True)
     state["response"] = response
 
     return state
 
 
-# ============== PLANNER AGENT ==============
-def planner_agent(state: AgentState) -> AgentState:
-    """
-    Planner Agent: Creates step-by-step plans for complex tasks.
+async def research_fanout(state: AgentState) -> Optional[str]:
     """
-    system_prompt = """You are a strategic planner and project manager. For complex tasks:
+    Split a research query into sub-questions, answer them concurrently and merge the answers.
 
-1. Understand the goal clearly
-2. Break it down into manageable steps
-3. Identify dependencies between steps
-4. Estimate complexity/effort for each step
-5. Suggest tools or resources needed
-6. Anticipate potential challenges
-
-Format your response as a clear, actionable plan with numbered steps.
-Include timeline suggestions if relevant."""
+    Returns:
+        The merged response, or None if no sub-questions could be extracted
+    """
+    analysis = await call_llm(PROMPTS["research_subquestions"], state["query"])
+    sub_questions = [
+        re.sub(r"^\s*(\d+[.)]|[-*\u2022])\s*", "", line).strip()
+        for line in analysis.split('\n')
+    ]
+    sub_questions = [q for q in sub_questions if q][:RESEARCH_MAX_SUBQUESTIONS]
+    if not sub_questions:
+        return None
+    state["research_context"] = "\n".join(sub_questions)
+
+    answers = await gather_llm(*[
+        call_llm(
+            PROMPTS["research"],
+            f"""This is part of a larger question: {state["query"]}
+
+Answer this aspect concisely: {sub_question}"""
+        )
+        for sub_question in sub_questions
+    ])
 
-    # First create a plan
-    plan_prompt = f"""Create a detailed plan for: {state["query"]}
+    response = "\n\n".join(
+        f"### {sub_question}\n\n{answer}"
+        for sub_question, answer in zip(sub_questions, answers)
+    )
+    emit_event("token", {"text": response})
+    return response
 
-List the steps needed to accomplish this task."""
 
-    plan_response = call_llm(
-        "You are a planning assistant. Create clear, actionable plans.",
-        plan_prompt,
-        temperature=0.3
+# ============== PLANNER AGENT ==============
+async def planner_agent(state: AgentState) -> AgentState:
+    """
+    Planner Agent: Creates step-by-step plans for complex tasks.
+    """
+    # The plan and the full response don't depend on each other, so issue both at once
+    plan_response, response = await gather_llm(
+        call_llm(PROMPTS["planning_steps"], state["query"]),
+        call_llm(PROMPTS["planning"], state["query"], history=state["history"], stream=True)
     )
 
     # Parse steps (simple extraction)
     steps = [line.strip() for line in plan_response.split('\n') if line.strip()]
     state["plan"] = steps
-
-    # Provide full response with plan
-    response = call_llm(system_prompt, state["query"])
     state["response"] = response
 
     return state
 
 
 # ============== CREATIVE AGENT ==============
-def creative_agent(state: AgentState) -> AgentState:
+async def creative_agent(state: AgentState) -> AgentState:
     """
     Creative Agent: Handles creative writing and content generation.
     """
-    system_prompt = """You are a creative writer with expertise in various styles and formats.
-You can help with:
-- Creative writing (stories, poems, scripts)
-- Content creation (blog posts, social media)
-- Brainstorming ideas
-- Developing characters and narratives
-- Writing in specific tones or styles
-
-Be imaginative, engaging, and adapt to the user's creative vision."""
-
-    response = call_llm(system_prompt, state["query"], temperature=0.9)
+    response = await call_llm(PROMPTS["creative"], state["query"], history=state["history"], stream=True)
     state["response"] = response
 
     return state
 
 
 # ============== MATH AGENT ==============
-def math_agent(state: AgentState) -> AgentState:
+async def math_agent(state: AgentState) -> AgentState:
     """
     Math Agent: Handles mathematical problems and calculations.
     """
-    system_prompt = """You are a mathematics expert. Help with:
-- Solving equations and problems
-- Explaining mathematical concepts
-- Step-by-step solutions
-- Proofs and derivations
-- Applied mathematics
-
-Always show your work step-by-step.
-Use clear mathematical notation.
-Verify your answers when possible."""
-
-    response = call_llm(system_prompt, state["query"], temperature=0.2)
+    response = await call_llm(PROMPTS["math"], state["query"], history=state["history"], stream=True)
     state["response"] = response
 
     return state
 
 
 # ============== CONVERSATION AGENT ==============
-def conversation_agent(state: AgentState) -> AgentState:
+async def conversation_agent(state: AgentState) -> AgentState:
     """
     Conversation Agent: Handles casual conversation and chitchat.
     """
-    system_prompt = """You are a friendly conversational assistant.
-Be warm, engaging, and natural in your responses.
-Keep responses concise for casual conversation.
-Show personality while being helpful."""
-
-    response = call_llm(system_prompt, state["query"], temperature=0.8)
+    response = await call_llm(PROMPTS["conversation"], state["query"], history=state["history"], stream=True)
     state["response"] = response
 
     return state
 
 
 # ============== RESPONSE ENHANCER ==============
-def response_enhancer(state: AgentState) -> AgentState:
+# What to tell the user for each LLMError kind instead of the raw API error
+LLM_ERROR_MESSAGES = {
+    "timeout": "Sorry, that took longer than expected to answer. Please try again.",
+    "rate_limited": "I'm handling a lot of requests right now. Please try again in a moment.",
+    "overloaded": "I'm handling a lot of requests right now. Please try again in a moment.",
+    "unavailable": "The AI service is temporarily unavailable. Please try again shortly.",
+    "rejected": "Sorry, I couldn't process that request.",
+    "error": "Sorry, something went wrong while generating the answer. Please try again."
+}
+
+
+async def response_enhancer(state: AgentState) -> AgentState:
     """
     Enhances the final response for clarity and completeness.
     """
     if state.get("error"):
-        state["response"] = f"I apologize, but I encountered an issue: {state['error']}"
+        message = LLM_ERROR_MESSAGES.get(state.get("error_kind"))
+        state["response"] = message or f"I apologize, but I encountered an issue: {state['error']}"
         return state
 
     if not state.get("response"):
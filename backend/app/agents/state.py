@@ -9,6 +9,9 @@ class AgentState(TypedDict):
     # Classification of the query type
     query_type: Optional[str]
 
+    # True when the LLM router failed and query_type is the "general" fallback
+    route_fallback: bool
+
     # Selected agent(s) to handle the query
     selected_agent: Optional[str]
 
@@ -30,6 +33,9 @@ class AgentState(TypedDict):
     # Error message if any
     error: Optional[str]
 
+    # LLMError kind ("timeout", "rate_limited", ...) when an LLM call failed
+    error_kind: Optional[str]
+
 
 # Query types that the router can classify
 QUERY_TYPES = Literal[
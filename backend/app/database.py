@@ -1,25 +1,85 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./voice_assistant.db")
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./voice_assistant.db")
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Connection pool (ignored for in-memory SQLite)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# SQLite tuning: WAL lets readers run alongside the writer, NORMAL skips an
+# fsync per commit (still durable across application crashes in WAL mode)
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+
+def async_database_url(url: str) -> str:
+    """Map plain sqlite:// and postgresql:// URLs onto their async drivers."""
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    for prefix in ("postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+
+def create_engine_from_url(url: str):
+    """Create the async engine with the configured pool and SQLite pragmas."""
+    url = async_database_url(url)
+    is_sqlite = url.startswith("sqlite")
+    options = {}
+    if not (is_sqlite and ":memory:" in url):
+        options.update(
+            # aiosqlite would otherwise open a new connection per session
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_timeout=DB_POOL_TIMEOUT
+        )
+    if not is_sqlite:
+        options["pool_pre_ping"] = True
+
+    engine = create_async_engine(url, **options)
+
+    if is_sqlite:
+        @event.listens_for(engine.sync_engine, "connect")
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+            cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+            cursor.close()
+
+    return engine
+
+
+engine = create_engine_from_url(DATABASE_URL)
+# Objects stay usable after commit; lazy loads aren't possible with async sessions
+SessionLocal = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 Base = declarative_base()
 
 
-def get_db():
+async def get_db():
     """Dependency for getting database sessions."""
-    db = SessionLocal()
-    try:
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
-def init_db():
-    """Initialize the database by creating all tables."""
+async def init_db():
+    """Initialize the database: create missing tables, then apply pending migrations."""
     from app.models import User, ChatSession, ChatMessage
-    Base.metadata.create_all(bind=engine)
+    from app.migrations import run_migrations
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    await run_migrations(engine)
+
+
+async def close_db():
+    """Close pooled connections; aiosqlite's connection threads otherwise keep the process alive."""
+    await engine.dispose()
@@ -1,31 +1,55 @@
 import os
-import tempfile
-from typing import Optional, List
+import re
+import json
+import logging
+import asyncio
+from typing import Dict, Optional, List, Tuple
 from datetime import timedelta
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends, BackgroundTasks, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from starlette.formparsers import MultiPartParser
 from pydantic import BaseModel, EmailStr
 from dotenv import load_dotenv
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 load_dotenv()
 
-from app.database import get_db, init_db
-from app.models import User, ChatSession, ChatMessage
-from app.services.llm import get_response, get_response_with_metadata, generate_session_title
-from app.services.speech import transcribe_audio, text_to_speech
+from app.database import get_db, init_db, close_db, engine, SessionLocal
+from app.models import User, ChatSession, ChatMessage, generate_uuid
+from app.services.llm import (
+    get_response, get_response_with_metadata, stream_response_with_metadata,
+    batch_responses, generate_session_title
+)
+from app.agents.classifier import train_from_db as train_classifier_from_db, get_stats as get_router_stats
+from app.agents.cache import response_cache
+from app.agents.coalesce import single_flight
+from app.agents.context import warm_up_tokenizer
+from app.agents.graph import BATCH_CONCURRENCY
+from app.services.speech import (
+    transcribe_audio, start_speech, validate_speech_options, read_audio_upload, audio_format,
+    MAX_UPLOAD_BYTES, speech_executor, tts_executor, warm_up_speech, AUDIO_FORMATS, AUDIO_EXTENSIONS, TTS_ENGINE
+)
+from app.services.llm_gateway import close_client as close_llm_client, scheduler as llm_scheduler
+from app.services.telemetry import (
+    TracingMiddleware, instrument_engine, log_event, log_listener, render_metrics, get_prompt_cache_stats
+)
+from app.services.tts_cache import tts_cache, tts_cache_key, cached_audio_response
 from app.services.auth import (
     create_user, authenticate_user, create_access_token,
-    get_current_user, get_optional_user, get_user_by_email,
+    get_current_user, get_optional_user, get_token_user, get_user_by_email, user_cache, hash_executor,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
 from app.services.chat import (
     create_session, get_session, get_user_sessions,
-    update_session_title, delete_session, add_message,
-    get_session_messages, get_session_history
+    update_session_title, delete_session, record_turn,
+    get_session_messages, get_session_history,
+    generate_session_title as provisional_session_title
 )
 
+# Keep voice uploads up to the size limit in memory instead of spooling them to disk
+MultiPartParser.max_file_size = MAX_UPLOAD_BYTES
+
 app = FastAPI(
     title="Voice Assistant API - Multi-Agent System",
     description="AI-powered voice assistant with specialized agents for different query types",
@@ -39,13 +63,31 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Content-Location", "ETag", "Server-Timing"],
 )
+# Per-request traces: Server-Timing header, latency histograms and a structured log line
+app.add_middleware(TracingMiddleware)
+instrument_engine(engine.sync_engine)
 
 
 # Initialize database on startup
 @app.on_event("startup")
-def startup_event():
-    init_db()
+async def startup_event():
+    await init_db()
+    warm_up_speech()
+    await warm_up_tokenizer()
+
+    # Train the local router fast path on previously classified queries
+    async with SessionLocal() as db:
+        await db.run_sync(train_classifier_from_db)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await close_db()
+    await close_llm_client()
+    # Flush queued log records
+    log_listener.stop()
 
 
 # ============== Request/Response Models ==============
@@ -55,6 +97,12 @@ class TextQuestion(BaseModel):
     session_id: Optional[str] = None
 
 
+class BatchQuestions(BaseModel):
+    questions: List[str]
+    # Questions answered at once; defaults to BATCH_CONCURRENCY
+    concurrency: Optional[int] = None
+
+
 class AnswerResponse(BaseModel):
     question: str
     answer: str
@@ -69,6 +117,17 @@ class DetailedAnswerResponse(BaseModel):
     session_id: Optional[str] = None
     session_title: Optional[str] = None
     message_id: Optional[str] = None
+    # True while an AI-generated title for a new session is still being produced
+    title_pending: bool = False
+
+
+class TTSRequest(BaseModel):
+    question: str
+    lang: str = "en"
+    # Engine-specific voice: a gTTS accent domain ("co.uk") or a Piper voice name
+    voice: Optional[str] = None
+    # Output codec: mp3, opus or pcm (16-bit mono 24 kHz)
+    format: str = "mp3"
 
 
 # Auth Models
@@ -127,24 +186,26 @@ class SessionWithMessagesResponse(BaseModel):
     created_at: str
     updated_at: str
     messages: List[MessageResponse]
+    # Pass as `before` to fetch the preceding page; None when there are no older messages
+    next_cursor: Optional[str] = None
 
 
 # ============== Auth Endpoints ==============
 
 @app.post("/api/auth/signup", response_model=TokenResponse)
-async def signup(data: UserSignup, db: Session = Depends(get_db)):
+async def signup(data: UserSignup, db: AsyncSession = Depends(get_db)):
     """Register a new user."""
     # Check if email already exists
-    existing_user = get_user_by_email(db, data.email)
+    existing_user = await get_user_by_email(db, data.email)
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
 
     # Create user
-    user = create_user(db, data.email, data.username, data.password)
+    user = await create_user(db, data.email, data.username, data.password)
 
     # Create access token
     access_token = create_access_token(
-        data={"sub": user.id},
+        data={"sub": user.id, "email": user.email, "username": user.username},
         expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     )
 
@@ -156,14 +217,14 @@ async def signup(data: UserSignup, db: Session = Depends(get_db)):
 
 
 @app.post("/api/auth/login", response_model=TokenResponse)
-async def login(data: UserLogin, db: Session = Depends(get_db)):
+async def login(data: UserLogin, db: AsyncSession = Depends(get_db)):
     """Login with email and password."""
-    user = authenticate_user(db, data.email, data.password)
+    user = await authenticate_user(db, data.email, data.password)
     if not user:
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
     access_token = create_access_token(
-        data={"sub": user.id},
+        data={"sub": user.id, "email": user.email, "username": user.username},
         expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     )
 
@@ -175,7 +236,7 @@ async def login(data: UserLogin, db: Session = Depends(get_db)):
 
 
 @app.get("/api/auth/me", response_model=UserResponse)
-async def get_me(current_user: User = Depends(get_current_user)):
+async def get_me(current_user: User = Depends(get_token_user)):
     """Get current user information."""
     return UserResponse(
         id=current_user.id,
@@ -190,10 +251,10 @@ async def get_me(current_user: User = Depends(get_current_user)):
 async def create_chat_session(
     data: SessionCreate = SessionCreate(),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Create a new chat session."""
-    session = create_session(db, current_user.id, data.title)
+    session = await create_session(db, current_user.id, data.title)
     return SessionResponse(
         id=session.id,
         title=session.title,
@@ -204,11 +265,11 @@ async def create_chat_session(
 
 @app.get("/api/sessions", response_model=List[SessionResponse])
 async def list_sessions(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_token_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """List all chat sessions for the current user."""
-    sessions = get_user_sessions(db, current_user.id)
+    sessions = await get_user_sessions(db, current_user.id)
     return [
         SessionResponse(
             id=s.id,
@@ -223,15 +284,23 @@ async def list_sessions(
 @app.get("/api/sessions/{session_id}", response_model=SessionWithMessagesResponse)
 async def get_chat_session(
     session_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    limit: Optional[int] = Query(None, ge=1, le=200),
+    before: Optional[str] = None,
+    current_user: User = Depends(get_token_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    """Get a chat session with all its messages."""
-    session = get_session(db, session_id, current_user.id)
+    """
+    Get a chat session with its messages.
+
+    Without `limit` all messages are returned. With it, only the newest `limit`
+    messages before the `before` cursor are returned, along with the cursor
+    of the next (older) page.
+    """
+    session = await get_session(db, session_id, current_user.id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    messages = get_session_messages(db, session_id)
+    messages, next_cursor = await get_session_messages(db, session_id, limit, before)
     return SessionWithMessagesResponse(
         id=session.id,
         title=session.title,
@@ -248,7 +317,8 @@ async def get_chat_session(
                 created_at=m.created_at.isoformat()
             )
             for m in messages
-        ]
+        ],
+        next_cursor=next_cursor
     )
 
 
@@ -257,10 +327,10 @@ async def update_chat_session(
     session_id: str,
     data: SessionUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Update a chat session's title."""
-    session = update_session_title(db, session_id, current_user.id, data.title)
+    session = await update_session_title(db, session_id, current_user.id, data.title)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
@@ -276,10 +346,10 @@ async def update_chat_session(
 async def delete_chat_session(
     session_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Delete a chat session and all its messages."""
-    success = delete_session(db, session_id, current_user.id)
+    success = await delete_session(db, session_id, current_user.id)
     if not success:
         raise HTTPException(status_code=404, detail="Session not found")
     return {"message": "Session deleted successfully"}
@@ -308,24 +378,155 @@ async def health_check():
     }
 
 
+@app.get("/api/stats")
+async def get_stats():
+    """Runtime counters for the agent pipeline."""
+    return {
+        "router": get_router_stats(),
+        "response_cache": response_cache.get_stats(),
+        "coalescing": single_flight.get_stats(),
+        "speech_pool": speech_executor.get_stats(),
+        "tts_pool": tts_executor.get_stats(),
+        "tts_cache": tts_cache.get_stats(),
+        "user_cache": user_cache.get_stats(),
+        "auth_pool": hash_executor.get_stats(),
+        "llm_scheduler": llm_scheduler.get_stats(),
+        "prompt_cache": get_prompt_cache_stats()
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus metrics: request, pipeline stage and LLM call latency plus token counts."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/api/ask/text", response_model=AnswerResponse)
 async def ask_text(data: TextQuestion):
     """Handle text-based questions using the multi-agent system."""
     if not data.question.strip():
         raise HTTPException(status_code=400, detail="Question cannot be empty")
 
-    print(f"[Query]: {data.question}")
-    answer = get_response(data.question)
-    print(f"[Response]: {answer[:100]}...")
+    log_event("query", question=data.question)
+    answer = await get_response(data.question)
+    log_event("answer", preview=answer[:100])
 
     return AnswerResponse(question=data.question, answer=answer)
 
 
+# Turns being written after their response was sent, by session id
+pending_turns: Dict[str, asyncio.Event] = {}
+PENDING_TURN_WAIT = 5
+
+
+async def load_session_history(db: AsyncSession, current_user: Optional[User], session_id: Optional[str]) -> List[dict]:
+    """Load history for an authenticated user's session, raising 404 if it isn't theirs."""
+    if not (current_user and session_id):
+        return []
+
+    # A follow-up can arrive before the previous turn's background write finished
+    pending = pending_turns.get(session_id)
+    if pending is not None:
+        try:
+            await asyncio.wait_for(pending.wait(), PENDING_TURN_WAIT)
+        except asyncio.TimeoutError:
+            pass
+
+    session = await get_session(db, session_id, current_user.id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return await get_session_history(db, session_id)
+
+
+async def save_conversation(
+    current_user: Optional[User],
+    session_id: Optional[str],
+    question: str,
+    result: dict,
+    background_tasks: Optional[BackgroundTasks] = None
+) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """
+    Persist a question/answer turn for an authenticated user.
+
+    When no session_id is given a new session is created with a provisional
+    title derived from the question; use finalize_session_title to replace it
+    with an AI-generated one off the request path. Ids are assigned up front,
+    so with `background_tasks` the write happens after the response is sent.
+
+    Returns:
+        (session_id, session_title, message_id) - all None for anonymous users
+    """
+    if not current_user:
+        return session_id, None, None
+
+    session_title = None
+    if not session_id:
+        session_title = provisional_session_title(question)
+        session_id = generate_uuid()
+    message_id = generate_uuid()
+
+    args = (current_user.id, session_id, question, result, message_id, session_title)
+    if background_tasks is not None:
+        pending = pending_turns[session_id] = asyncio.Event()
+        background_tasks.add_task(persist_turn, *args, pending)
+    else:
+        await persist_turn(*args)
+    return session_id, session_title, message_id
+
+
+async def persist_turn(
+    user_id: str,
+    session_id: str,
+    question: str,
+    result: dict,
+    message_id: str,
+    session_title: Optional[str],
+    pending: Optional[asyncio.Event] = None
+) -> None:
+    """
+    Write a turn with record_turn using its own database session.
+    `pending` is set (and dropped from pending_turns) once the write is done.
+    """
+    async with SessionLocal() as db:
+        try:
+            await record_turn(
+                db, user_id, session_id, question, result.get("response", ""),
+                query_type=result.get("query_type"),
+                agent_used=result.get("agent_used"),
+                plan=result.get("plan"),
+                message_id=message_id,
+                new_session_title=session_title
+            )
+        except Exception as e:
+            log_event("save_conversation_error", logging.ERROR, session_id=session_id, error=str(e))
+        finally:
+            if pending is not None:
+                if pending_turns.get(session_id) is pending:
+                    del pending_turns[session_id]
+                pending.set()
+
+
+async def finalize_session_title(session_id: str, user_id: str, question: str, answer: str) -> str:
+    """Replace a new session's provisional title with an AI-generated one."""
+    title = await generate_session_title(question, answer)
+
+    # Runs after the response is sent, so it can't use the request's session
+    async with SessionLocal() as db:
+        await update_session_title(db, session_id, user_id, title)
+    return title
+
+
+def format_sse(event: str, data: dict) -> str:
+    """Encode a server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
 @app.post("/api/ask/text/detailed", response_model=DetailedAnswerResponse)
 async def ask_text_detailed(
     data: TextQuestion,
+    background_tasks: BackgroundTasks,
     current_user: Optional[User] = Depends(get_optional_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Handle text-based questions with detailed agent metadata.
@@ -334,48 +535,22 @@ async def ask_text_detailed(
     if not data.question.strip():
         raise HTTPException(status_code=400, detail="Question cannot be empty")
 
-    session_id = data.session_id
-    history = []
-    is_new_session = False
-
-    # If user is authenticated and session_id provided, load history
-    if current_user and session_id:
-        session = get_session(db, session_id, current_user.id)
-        if session:
-            history = get_session_history(db, session_id)
-        else:
-            raise HTTPException(status_code=404, detail="Session not found")
+    history = await load_session_history(db, current_user, data.session_id)
 
-    # Track if we need to create a new session
-    if current_user and not session_id:
-        is_new_session = True
+    log_event("query", question=data.question, session_id=data.session_id)
+    result = await get_response_with_metadata(data.question, history=history, session_id=data.session_id)
+    log_event("answer", agent_used=result.get("agent_used"), preview=result.get("response", "")[:100])
 
-    print(f"[Query]: {data.question}")
-    result = get_response_with_metadata(data.question, history=history)
-    print(f"[Agent Used]: {result.get('agent_used')}")
-    print(f"[Response]: {result.get('response', '')[:100]}...")
-
-    message_id = None
-    session_title = None
+    # Saved after the response is sent; the title task below runs after it
+    session_id, session_title, message_id = await save_conversation(
+        current_user, data.session_id, data.question, result, background_tasks
+    )
 
-    # Create new session with AI-generated title (after we have the response)
-    if current_user and is_new_session:
-        session_title = generate_session_title(data.question, result.get("response", ""))
-        new_session = create_session(db, current_user.id, session_title)
-        session_id = new_session.id
-
-    # Save messages to session if authenticated
-    if current_user and session_id:
-        # Save user message
-        add_message(db, session_id, "user", data.question)
-        # Save assistant message
-        assistant_msg = add_message(
-            db, session_id, "assistant", result.get("response", ""),
-            query_type=result.get("query_type"),
-            agent_used=result.get("agent_used"),
-            plan=result.get("plan")
+    title_pending = session_title is not None
+    if title_pending:
+        background_tasks.add_task(
+            finalize_session_title, session_id, current_user.id, data.question, result.get("response", "")
         )
-        message_id = assistant_msg.id
 
     return DetailedAnswerResponse(
         question=data.question,
@@ -385,7 +560,126 @@ async def ask_text_detailed(
         plan=result.get("plan"),
         session_id=session_id,
         session_title=session_title,
-        message_id=message_id
+        message_id=message_id,
+        title_pending=title_pending
+    )
+
+
+@app.post("/api/ask/text/stream")
+async def ask_text_stream(
+    data: TextQuestion,
+    current_user: Optional[User] = Depends(get_optional_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Streaming variant of /api/ask/text/detailed using server-sent events.
+
+    Emits a "route" event with the chosen query_type, "token" events as the
+    specialist's answer arrives, then a "done" event with the same payload as
+    the detailed endpoint once the conversation has been saved. For a new
+    session a final "title" event carries the AI-generated session title.
+    """
+    if not data.question.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty")
+
+    history = await load_session_history(db, current_user, data.session_id)
+    log_event("query", question=data.question, session_id=data.session_id, stream=True)
+
+    async def event_stream():
+        result = None
+        async for event, payload in stream_response_with_metadata(data.question, history=history, session_id=data.session_id):
+            if event == "result":
+                result = payload
+            else:
+                yield format_sse(event, payload)
+
+        if not result or not result.get("success", False):
+            error = (result or {}).get("error", "Unknown error occurred")
+            log_event("agent_error", logging.ERROR, error=error)
+            yield format_sse("error", {"detail": f"Agent Error: {error}"})
+            return
+
+        log_event("answer", agent_used=result.get("agent_used"), preview=result.get("response", "")[:100])
+
+        # The whole answer has already been streamed, so the write doesn't delay it
+        session_id, session_title, message_id = await save_conversation(
+            current_user, data.session_id, data.question, result
+        )
+
+        title_pending = session_title is not None
+        if title_pending:
+            title_task = asyncio.create_task(finalize_session_title(
+                session_id, current_user.id, data.question, result.get("response", "")
+            ))
+
+        yield format_sse("done", DetailedAnswerResponse(
+            question=data.question,
+            answer=result.get("response", ""),
+            query_type=result.get("query_type"),
+            agent_used=result.get("agent_used"),
+            plan=result.get("plan"),
+            session_id=session_id,
+            session_title=session_title,
+            message_id=message_id,
+            title_pending=title_pending
+        ).model_dump())
+
+        if title_pending:
+            yield format_sse("title", {"session_id": session_id, "session_title": await title_task})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# Largest batch accepted by /api/ask/batch, and the most questions it answers at once
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "32"))
+
+
+@app.post("/api/ask/batch")
+async def ask_batch(data: BatchQuestions):
+    """
+    Answer many independent questions in one request (evaluation runs, FAQ
+    pre-generation) and stream the results as newline-delimited JSON.
+
+    Questions are routed together and answered at background priority, so
+    interactive users keep precedence. Each line is emitted as soon as its
+    question completes, so lines arrive out of order; match them up by
+    "index". Nothing is saved to chat history.
+    """
+    questions = data.questions
+    if not questions:
+        raise HTTPException(status_code=400, detail="Questions cannot be empty")
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+    if any(not question.strip() for question in questions):
+        raise HTTPException(status_code=400, detail="Question cannot be empty")
+
+    concurrency = min(max(data.concurrency or BATCH_CONCURRENCY, 1), BATCH_MAX_CONCURRENCY)
+    log_event("batch", questions=len(questions), concurrency=concurrency)
+
+    async def result_stream():
+        async for index, result in batch_responses(questions, concurrency):
+            line = {
+                "index": index,
+                "question": questions[index],
+                "answer": result.get("response", ""),
+                "query_type": result.get("query_type"),
+                "agent_used": result.get("agent_used"),
+                "plan": result.get("plan"),
+                "success": result.get("success", False)
+            }
+            if not line["success"]:
+                line["error"] = result.get("error", "Unknown error occurred")
+            yield json.dumps(line) + "\n"
+
+    return StreamingResponse(
+        result_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
 
@@ -395,126 +689,123 @@ async def ask_voice(audio: UploadFile = File(...)):
     if not audio.filename:
         raise HTTPException(status_code=400, detail="No audio file provided")
 
-    # Get file extension from uploaded file
-    ext = os.path.splitext(audio.filename)[1] if audio.filename else ".webm"
-    if not ext:
-        ext = ".webm"
+    content = await read_audio_upload(audio)
+    question = await transcribe_audio(content, audio_format(audio.filename))
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-        content = await audio.read()
-        tmp.write(content)
-        tmp_path = tmp.name
+    if not question.strip():
+        raise HTTPException(status_code=400, detail="Could not transcribe audio")
 
-    try:
-        question = transcribe_audio(tmp_path)
+    log_event("query", question=question, voice=True)
+    answer = await get_response(question)
+    log_event("answer", preview=answer[:100])
 
-        if not question.strip():
-            raise HTTPException(status_code=400, detail="Could not transcribe audio")
-
-        print(f"[Voice Query]: {question}")
-        answer = get_response(question)
-        print(f"[Response]: {answer[:100]}...")
-
-        return AnswerResponse(question=question, answer=answer)
-    finally:
-        if os.path.exists(tmp_path):
-            os.unlink(tmp_path)
+    return AnswerResponse(question=question, answer=answer)
 
 
 @app.post("/api/ask/voice/detailed", response_model=DetailedAnswerResponse)
 async def ask_voice_detailed(
+    background_tasks: BackgroundTasks,
     audio: UploadFile = File(...),
     session_id: Optional[str] = Form(None),
     current_user: Optional[User] = Depends(get_optional_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Handle voice-based questions with detailed agent metadata."""
     if not audio.filename:
         raise HTTPException(status_code=400, detail="No audio file provided")
 
-    ext = os.path.splitext(audio.filename)[1] if audio.filename else ".webm"
-    if not ext:
-        ext = ".webm"
+    content = await read_audio_upload(audio)
+    question = await transcribe_audio(content, audio_format(audio.filename))
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-        content = await audio.read()
-        tmp.write(content)
-        tmp_path = tmp.name
+    if not question.strip():
+        raise HTTPException(status_code=400, detail="Could not transcribe audio")
 
-    try:
-        question = transcribe_audio(tmp_path)
+    history = await load_session_history(db, current_user, session_id)
 
-        if not question.strip():
-            raise HTTPException(status_code=400, detail="Could not transcribe audio")
+    log_event("query", question=question, session_id=session_id, voice=True)
+    result = await get_response_with_metadata(question, history=history, session_id=session_id)
+    log_event("answer", agent_used=result.get("agent_used"), preview=result.get("response", "")[:100])
 
-        history = []
-        is_new_session = False
-
-        # If user is authenticated and session_id provided, load history
-        if current_user and session_id:
-            session = get_session(db, session_id, current_user.id)
-            if session:
-                history = get_session_history(db, session_id)
-            else:
-                raise HTTPException(status_code=404, detail="Session not found")
-
-        # Track if we need to create a new session
-        if current_user and not session_id:
-            is_new_session = True
-
-        print(f"[Voice Query]: {question}")
-        result = get_response_with_metadata(question, history=history)
-        print(f"[Agent Used]: {result.get('agent_used')}")
-
-        message_id = None
-        session_title = None
-
-        # Create new session with AI-generated title (after we have the response)
-        if current_user and is_new_session:
-            session_title = generate_session_title(question, result.get("response", ""))
-            new_session = create_session(db, current_user.id, session_title)
-            session_id = new_session.id
-
-        # Save messages to session if authenticated
-        if current_user and session_id:
-            add_message(db, session_id, "user", question)
-            assistant_msg = add_message(
-                db, session_id, "assistant", result.get("response", ""),
-                query_type=result.get("query_type"),
-                agent_used=result.get("agent_used"),
-                plan=result.get("plan")
-            )
-            message_id = assistant_msg.id
+    session_id, session_title, message_id = await save_conversation(
+        current_user, session_id, question, result, background_tasks
+    )
 
-        return DetailedAnswerResponse(
-            question=question,
-            answer=result.get("response", ""),
-            query_type=result.get("query_type"),
-            agent_used=result.get("agent_used"),
-            plan=result.get("plan"),
-            session_id=session_id,
-            session_title=session_title,
-            message_id=message_id
+    title_pending = session_title is not None
+    if title_pending:
+        background_tasks.add_task(
+            finalize_session_title, session_id, current_user.id, question, result.get("response", "")
         )
-    finally:
-        if os.path.exists(tmp_path):
-            os.unlink(tmp_path)
+
+    return DetailedAnswerResponse(
+        question=question,
+        answer=result.get("response", ""),
+        query_type=result.get("query_type"),
+        agent_used=result.get("agent_used"),
+        plan=result.get("plan"),
+        session_id=session_id,
+        session_title=session_title,
+        message_id=message_id,
+        title_pending=title_pending
+    )
 
 
 @app.post("/api/tts")
-async def tts_endpoint(data: TextQuestion):
-    """Convert text to speech and return audio file."""
+async def tts_endpoint(data: TTSRequest, request: Request):
+    """
+    Convert text to speech in the requested format (mp3, opus or pcm).
+
+    Clips are cached by content, so replays are served from disk (with ETag
+    and Range support). On a miss the audio is streamed sentence by sentence
+    while later sentences are still being synthesized.
+    """
     if not data.question.strip():
         raise HTTPException(status_code=400, detail="Text cannot be empty")
+    if data.format not in AUDIO_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported format. Choose one of: {', '.join(AUDIO_FORMATS)}"
+        )
+    # `voice` chooses the host gTTS sends the text to, so it must come from the engine's own list
+    validate_speech_options(data.lang, data.voice)
+
+    key = tts_cache_key(data.question, data.lang, data.voice, data.format, TTS_ENGINE)
+    audio_id = f"{key}.{AUDIO_EXTENSIONS[data.format]}"
+    media_type = AUDIO_FORMATS[data.format][0]
+    headers = {
+        "Content-Disposition": f"attachment; filename=response.{AUDIO_EXTENSIONS[data.format]}",
+        "Content-Location": f"/api/tts/{audio_id}"
+    }
 
-    audio_buffer = text_to_speech(data.question)
+    cached_path = await tts_cache.get(audio_id)
+    if cached_path:
+        response = await cached_audio_response(request, cached_path, audio_id, media_type)
+        response.headers.update(headers)
+        return response
+
+    # The first sentence is synthesized before the 200 is sent, so engine errors keep their status
+    audio = await start_speech(data.question, data.lang, data.voice, data.format)
     return StreamingResponse(
-        audio_buffer,
-        media_type="audio/mpeg",
-        headers={"Content-Disposition": "attachment; filename=response.mp3"}
+        tts_cache.store_stream(audio_id, audio),
+        media_type=media_type,
+        headers={**headers, "ETag": f'"{audio_id}"'}
     )
 
 
+@app.get("/api/tts/{audio_id}")
+async def get_tts_audio(audio_id: str, request: Request):
+    """Replay a previously synthesized clip (see the Content-Location of POST /api/tts)."""
+    match = re.fullmatch(r"[0-9a-f]{64}\.(\w+)", audio_id)
+    formats_by_extension = {ext: fmt for fmt, ext in AUDIO_EXTENSIONS.items()}
+    if not match or match.group(1) not in formats_by_extension:
+        raise HTTPException(status_code=404, detail="Audio not found")
+
+    cached_path = await tts_cache.get(audio_id)
+    if not cached_path:
+        raise HTTPException(status_code=404, detail="Audio not found")
+    media_type = AUDIO_FORMATS[formats_by_extension[match.group(1)]][0]
+    return await cached_audio_response(request, cached_path, audio_id, media_type)
+
+
 @app.get("/api/agents")
 async def list_agents():
     """List all available agents and their capabilities."""
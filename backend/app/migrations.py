@@ -0,0 +1,54 @@
+from datetime import datetime
+from typing import List, Tuple
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.services.telemetry import log_event
+
+# Schema changes for databases created before the current models, applied in
+# order and recorded in schema_migrations. `create_all` only creates missing
+# tables, so anything added to an existing table (indexes, columns) goes here.
+# Never edit an entry once released; append a new one instead.
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, "composite indexes for session history and session list", [
+        "CREATE INDEX IF NOT EXISTS ix_chat_messages_session_created "
+        "ON chat_messages (session_id, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_chat_sessions_user_updated "
+        "ON chat_sessions (user_id, updated_at)",
+    ]),
+]
+
+
+async def run_migrations(engine: AsyncEngine) -> List[int]:
+    """
+    Apply pending migrations, each in its own transaction.
+
+    Returns:
+        Versions applied by this call
+    """
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, description TEXT NOT NULL, applied_at TIMESTAMP NOT NULL)"
+        ))
+        applied = set((await conn.execute(text("SELECT version FROM schema_migrations"))).scalars())
+
+    newly_applied = []
+    for version, description, statements in sorted(MIGRATIONS):
+        if version in applied:
+            continue
+        try:
+            async with engine.begin() as conn:
+                for statement in statements:
+                    await conn.execute(text(statement))
+                await conn.execute(
+                    text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)"),
+                    {"v": version, "d": description, "t": datetime.utcnow()}
+                )
+        except IntegrityError:
+            # Another worker starting at the same time applied it first
+            continue
+        log_event("migration_applied", version=version, description=description)
+        newly_applied.append(version)
+    return newly_applied
@@ -1,22 +1,103 @@
 import os
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Any, Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import get_db
 from app.models import User
+from app.services.workers import BoundedExecutor
 
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
+# Seconds an authenticated user record is reused before it is re-read from the database
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+# Let read-only endpoints build the user from the token's claims without any lookup
+TRUST_TOKEN_CLAIMS = os.getenv("AUTH_TRUST_TOKEN_CLAIMS", "false").lower() == "true"
+
+# bcrypt is deliberately slow CPU work (and releases the GIL), so it runs on its own pool
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# A few hashes per worker: past that a login would wait seconds, so shed it with 429
+AUTH_HASH_MAX_QUEUE = int(os.getenv("AUTH_HASH_MAX_QUEUE", str(4 * AUTH_HASH_WORKERS)))
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
+hash_executor = BoundedExecutor(
+    "auth-hash",
+    AUTH_HASH_WORKERS,
+    AUTH_HASH_MAX_QUEUE,
+    saturated_status=429,
+    saturated_detail="Too many login attempts in progress, please try again shortly.",
+    retry_after=1
+)
+
+
+class UserCache:
+    """
+    In-process TTL cache of user records keyed by user id, LRU-bounded.
+
+    Entries are invalidated whenever a User row is updated or deleted through
+    the ORM (see the mapper events below); other workers see such changes
+    once their entry's TTL expires.
+    """
+
+    def __init__(self, ttl: int = USER_CACHE_TTL, max_entries: int = USER_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Tuple[float, User]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: str) -> Optional[User]:
+        entry = self.entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            self.entries.pop(user_id, None)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(user_id)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, user: User) -> None:
+        if self.ttl <= 0:
+            return
+        self.entries[user.id] = (time.monotonic() + self.ttl, user)
+        self.entries.move_to_end(user.id)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, user_id: str) -> None:
+        self.entries.pop(user_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "ttl": self.ttl,
+            "trust_token_claims": TRUST_TOKEN_CLAIMS
+        }
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def invalidate_cached_user(mapper, connection, target: User) -> None:
+    """Drop a user's cached record when their account changes."""
+    user_cache.invalidate(target.id)
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash."""
@@ -49,43 +130,56 @@ def decode_token(token: str) -> Optional[dict]:
         return None
 
 
-def get_user_by_email(db: Session, email: str) -> Optional[User]:
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
     """Get a user by email."""
-    return db.query(User).filter(User.email == email).first()
+    return await db.scalar(select(User).where(User.email == email))
 
 
-def get_user_by_id(db: Session, user_id: str) -> Optional[User]:
+async def get_user_by_id(db: AsyncSession, user_id: str) -> Optional[User]:
     """Get a user by ID."""
-    return db.query(User).filter(User.id == user_id).first()
+    return await db.scalar(select(User).where(User.id == user_id))
+
+
+async def get_cached_user(db: AsyncSession, user_id: str) -> Optional[User]:
+    """Get a user by ID, from the user cache when possible."""
+    user = user_cache.get(user_id)
+    if user is None:
+        user = await get_user_by_id(db, user_id)
+        if user is not None:
+            user_cache.set(user)
+    return user
 
 
-def create_user(db: Session, email: str, username: str, password: str) -> User:
+async def create_user(db: AsyncSession, email: str, username: str, password: str) -> User:
     """Create a new user."""
-    hashed_password = get_password_hash(password)
+    # End any open read transaction so no pooled connection is held during the slow hash
+    await db.commit()
+    hashed_password = await hash_executor.run(get_password_hash, password)
     user = User(
         email=email,
         username=username,
         password_hash=hashed_password
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
     return user
 
 
-def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
+async def authenticate_user(db: AsyncSession, email: str, password: str) -> Optional[User]:
     """Authenticate a user by email and password."""
-    user = get_user_by_email(db, email)
+    user = await get_user_by_email(db, email)
     if not user:
         return None
-    if not verify_password(password, user.password_hash):
+    # Release the connection while waiting for the hash pool
+    await db.commit()
+    if not await hash_executor.run(verify_password, password, user.password_hash):
         return None
     return user
 
 
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> User:
     """Get the current authenticated user from the JWT token."""
     credentials_exception = HTTPException(
@@ -104,16 +198,35 @@ async def get_current_user(
     if user_id is None:
         raise credentials_exception
 
-    user = get_user_by_id(db, user_id)
+    user = await get_cached_user(db, user_id)
     if user is None:
         raise credentials_exception
 
     return user
 
 
+async def get_token_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    """
+    Get the current user for read-only endpoints.
+
+    With AUTH_TRUST_TOKEN_CLAIMS enabled the user is built from the token's
+    claims without touching the database, so a deleted account keeps read
+    access until its token expires. Otherwise this is get_current_user.
+    """
+    if TRUST_TOKEN_CLAIMS:
+        payload = decode_token(credentials.credentials)
+        if payload and payload.get("sub") and payload.get("email") and payload.get("username"):
+            return User(id=payload["sub"], email=payload["email"], username=payload["username"])
+
+    return await get_current_user(credentials, db)
+
+
 async def get_optional_user(
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False)),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> Optional[User]:
     """Get the current user if authenticated, otherwise return None."""
     if credentials is None:
@@ -129,4 +242,4 @@ async def get_optional_user(
     if user_id is None:
         return None
 
-    return get_user_by_id(db, user_id)
+    return await get_cached_user(db, user_id)
@@ -1,97 +1,186 @@
-from typing import List, Optional
-from datetime import datetime
-from sqlalchemy.orm import Session
-from app.models import ChatSession, ChatMessage
+import os
+import base64
+import binascii
+from typing import List, Optional, Tuple
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from sqlalchemy import and_, or_, select, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import ChatSession, ChatMessage, generate_uuid
 
+# Most recent messages loaded as agent history (older turns live in the rolling summary)
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "40"))
 
-def create_session(db: Session, user_id: str, title: str = "New Chat") -> ChatSession:
+
+async def create_session(db: AsyncSession, user_id: str, title: str = "New Chat") -> ChatSession:
     """Create a new chat session for a user."""
     session = ChatSession(user_id=user_id, title=title)
     db.add(session)
-    db.commit()
-    db.refresh(session)
+    await db.commit()
     return session
 
 
-def get_session(db: Session, session_id: str, user_id: str) -> Optional[ChatSession]:
+async def get_session(db: AsyncSession, session_id: str, user_id: str) -> Optional[ChatSession]:
     """Get a chat session by ID, ensuring it belongs to the user."""
-    return db.query(ChatSession).filter(
+    return await db.scalar(select(ChatSession).where(
         ChatSession.id == session_id,
         ChatSession.user_id == user_id
-    ).first()
+    ))
 
 
-def get_user_sessions(db: Session, user_id: str) -> List[ChatSession]:
+async def get_user_sessions(db: AsyncSession, user_id: str) -> List[ChatSession]:
     """Get all chat sessions for a user, ordered by most recent."""
-    return db.query(ChatSession).filter(
+    result = await db.scalars(select(ChatSession).where(
         ChatSession.user_id == user_id
-    ).order_by(ChatSession.updated_at.desc()).all()
+    ).order_by(ChatSession.updated_at.desc()))
+    return list(result)
 
 
-def update_session_title(db: Session, session_id: str, user_id: str, title: str) -> Optional[ChatSession]:
+async def update_session_title(db: AsyncSession, session_id: str, user_id: str, title: str) -> Optional[ChatSession]:
     """Update the title of a chat session."""
-    session = get_session(db, session_id, user_id)
+    session = await get_session(db, session_id, user_id)
     if session:
         session.title = title
         session.updated_at = datetime.utcnow()
-        db.commit()
-        db.refresh(session)
+        await db.commit()
     return session
 
 
-def delete_session(db: Session, session_id: str, user_id: str) -> bool:
+async def delete_session(db: AsyncSession, session_id: str, user_id: str) -> bool:
     """Delete a chat session and all its messages."""
-    session = get_session(db, session_id, user_id)
+    session = await get_session(db, session_id, user_id)
     if session:
-        db.delete(session)
-        db.commit()
+        # Bulk delete instead of loading every message for the ORM cascade
+        await db.execute(delete(ChatMessage).where(ChatMessage.session_id == session_id))
+        await db.execute(delete(ChatSession).where(ChatSession.id == session_id))
+        await db.commit()
         return True
     return False
 
 
-def add_message(
-    db: Session,
+async def record_turn(
+    db: AsyncSession,
+    user_id: str,
     session_id: str,
-    role: str,
-    content: str,
+    question: str,
+    answer: str,
     query_type: Optional[str] = None,
     agent_used: Optional[str] = None,
-    plan: Optional[List[str]] = None
-) -> ChatMessage:
-    """Add a message to a chat session."""
-    message = ChatMessage(
-        session_id=session_id,
-        role=role,
-        content=content,
-        query_type=query_type,
-        agent_used=agent_used,
-        plan=plan
-    )
-    db.add(message)
-
-    # Update session's updated_at timestamp
-    session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
-    if session:
-        session.updated_at = datetime.utcnow()
-
-    db.commit()
-    db.refresh(message)
-    return message
-
-
-def get_session_messages(db: Session, session_id: str) -> List[ChatMessage]:
-    """Get all messages for a chat session, ordered by creation time."""
-    return db.query(ChatMessage).filter(
+    plan: Optional[List[str]] = None,
+    message_id: Optional[str] = None,
+    new_session_title: Optional[str] = None
+) -> str:
+    """
+    Save a question/answer turn in a single transaction.
+
+    Writes the user and assistant messages and bumps the session's updated_at,
+    creating the session first when `new_session_title` is given. Ids are
+    generated up front so callers can return them before the write happens,
+    and nothing is refreshed afterwards.
+
+    Returns:
+        The assistant message id
+    """
+    now = datetime.utcnow()
+    message_id = message_id or generate_uuid()
+
+    if new_session_title is not None:
+        db.add(ChatSession(id=session_id, user_id=user_id, title=new_session_title, created_at=now, updated_at=now))
+    else:
+        await db.execute(
+            update(ChatSession).where(ChatSession.id == session_id).values(updated_at=now)
+        )
+
+    db.add_all([
+        ChatMessage(session_id=session_id, role="user", content=question, created_at=now),
+        # Strictly later than the question so (created_at, id) ordering keeps the pair in order
+        ChatMessage(
+            id=message_id,
+            session_id=session_id,
+            role="assistant",
+            content=answer,
+            query_type=query_type,
+            agent_used=agent_used,
+            plan=plan,
+            created_at=now + timedelta(microseconds=1)
+        )
+    ])
+    await db.commit()
+    return message_id
+
+
+def encode_cursor(message: ChatMessage) -> str:
+    """Opaque pagination cursor pointing at a message's (created_at, id) position."""
+    raw = f"{message.created_at.isoformat()}|{message.id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Parse a cursor from encode_cursor, raising 400 if it is malformed."""
+    try:
+        created_at, message_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(created_at), message_id
+    except (ValueError, UnicodeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def get_session_messages(
+    db: AsyncSession,
+    session_id: str,
+    limit: Optional[int] = None,
+    before: Optional[str] = None
+) -> Tuple[List[ChatMessage], Optional[str]]:
+    """
+    Get messages for a chat session, ordered by creation time.
+
+    Pages are keyset-paginated on (created_at, id): pass `limit` to get the
+    newest `limit` messages, and the returned cursor as `before` to get the
+    page preceding them.
+
+    Returns:
+        (messages oldest first, cursor for the previous page or None if there are no older messages)
+    """
+    query = select(ChatMessage).where(ChatMessage.session_id == session_id)
+
+    if before:
+        created_at, message_id = decode_cursor(before)
+        query = query.where(or_(
+            ChatMessage.created_at < created_at,
+            and_(ChatMessage.created_at == created_at, ChatMessage.id < message_id)
+        ))
+
+    if limit is None:
+        result = await db.scalars(query.order_by(ChatMessage.created_at.asc(), ChatMessage.id.asc()))
+        return list(result), None
+
+    # One extra row tells us whether an older page exists
+    result = await db.scalars(query.order_by(
+        ChatMessage.created_at.desc(), ChatMessage.id.desc()
+    ).limit(limit + 1))
+    messages = list(result)
+
+    has_more = len(messages) > limit
+    messages = messages[:limit][::-1]
+    return messages, encode_cursor(messages[0]) if has_more else None
+
+
+async def get_session_history(db: AsyncSession, session_id: str, limit: int = HISTORY_MAX_MESSAGES) -> List[dict]:
+    """
+    Get the last `limit` messages in the format expected by the LLM, plus message ids for summary tracking.
+
+    Only the needed columns are selected, so no ORM objects are built.
+    """
+    rows = (await db.execute(select(
+        ChatMessage.id, ChatMessage.role, ChatMessage.content
+    ).where(
         ChatMessage.session_id == session_id
-    ).order_by(ChatMessage.created_at.asc()).all()
-
+    ).order_by(
+        ChatMessage.created_at.desc(), ChatMessage.id.desc()
+    ).limit(limit))).all()
 
-def get_session_history(db: Session, session_id: str) -> List[dict]:
-    """Get chat history in the format expected by the LLM."""
-    messages = get_session_messages(db, session_id)
     return [
-        {"role": msg.role, "content": msg.content}
-        for msg in messages
+        {"id": message_id, "role": role, "content": content}
+        for message_id, role, content in reversed(rows)
     ]
 
 
@@ -1,25 +1,30 @@
-import os
-from typing import Dict, Any
+import logging
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
 from fastapi import HTTPException
-from openai import OpenAI
-from app.agents import run_agent
+from app.agents import run_agent, stream_agent, run_batch
+from app.agents.graph import BATCH_CONCURRENCY
+from app.agents.prompts import PROMPTS
+from app.services.llm_gateway import BACKGROUND, complete
+from app.services.telemetry import log_event, span, current_agent
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Seconds to wait for a title before falling back to the question itself
+TITLE_TIMEOUT = 15
 
 
-def get_response(query: str, history: list = None) -> str:
+async def get_response(query: str, history: list = None, session_id: Optional[str] = None) -> str:
     """
     Process a query through the multi-agent system.
 
     Args:
         query: The user's question/request
         history: Optional conversation history
+        session_id: Session the history belongs to (for its cached summary)
 
     Returns:
         The agent's response string
     """
     try:
-        result = run_agent(query, history)
+        result = await run_agent(query, history, session_id)
 
         if not result.get("success", False):
             raise HTTPException(
@@ -32,23 +37,24 @@ def get_response(query: str, history: list = None) -> str:
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[Agent Error]: {e}")
+        log_event("agent_error", logging.ERROR, error=str(e))
         raise HTTPException(status_code=500, detail=f"Agent Error: {str(e)}")
 
 
-def get_response_with_metadata(query: str, history: list = None) -> Dict[str, Any]:
+async def get_response_with_metadata(query: str, history: list = None, session_id: Optional[str] = None) -> Dict[str, Any]:
     """
     Process a query and return full metadata about the agent execution.
 
     Args:
         query: The user's question/request
         history: Optional conversation history
+        session_id: Session the history belongs to (for its cached summary)
 
     Returns:
         Dict with response and metadata (query_type, agent_used, plan, etc.)
     """
     try:
-        result = run_agent(query, history)
+        result = await run_agent(query, history, session_id)
 
         if not result.get("success", False):
             raise HTTPException(
@@ -61,11 +67,52 @@ def get_response_with_metadata(query: str, history: list = None) -> Dict[str, An
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[Agent Error]: {e}")
+        log_event("agent_error", logging.ERROR, error=str(e))
         raise HTTPException(status_code=500, detail=f"Agent Error: {str(e)}")
 
 
-def generate_session_title(user_message: str, assistant_response: str) -> str:
+async def stream_response_with_metadata(
+    query: str,
+    history: list = None,
+    session_id: Optional[str] = None
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Process a query and stream its progress through the multi-agent system.
+
+    Args:
+        query: The user's question/request
+        history: Optional conversation history
+        session_id: Session the history belongs to (for its cached summary)
+
+    Yields:
+        (event, data) tuples: "route" once the query is classified, "token" for
+        each chunk of the answer, then "result" with the same dict as
+        get_response_with_metadata (check its "success" flag).
+    """
+    async for event, data in stream_agent(query, history, session_id):
+        yield event, data
+
+
+async def batch_responses(
+    queries: List[str],
+    concurrency: int = BATCH_CONCURRENCY
+) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Process many independent queries through the multi-agent system.
+
+    Args:
+        queries: The questions to answer, each without conversation history
+        concurrency: Maximum number of queries answered at once
+
+    Yields:
+        (index, result) tuples in completion order, where result is the same
+        dict as get_response_with_metadata (check its "success" flag).
+    """
+    async for index, result in run_batch(queries, concurrency):
+        yield index, result
+
+
+async def generate_session_title(user_message: str, assistant_response: str) -> str:
     """
     Generate a concise, descriptive title for a chat session based on the conversation content.
 
@@ -77,33 +124,27 @@ def generate_session_title(user_message: str, assistant_response: str) -> str:
         A short title (3-6 words) summarizing the conversation topic
     """
     try:
-        system_prompt = """Generate a very short, concise title (3-6 words max) for this conversation.
-The title should capture the main topic or intent.
-Do NOT use quotes around the title.
-Do NOT include words like "Chat about" or "Discussion on".
-Just provide the topic directly.
-
-Examples:
-- "Python List Sorting"
-- "Photo Editing Tips"
-- "Morning Greeting"
-- "Quantum Physics Basics"
-- "Recipe for Pasta"
-"""
-
+        prompt = PROMPTS["title"]
         content = f"User asked: {user_message}\n\nAssistant replied: {assistant_response[:200]}"
 
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": content}
-            ],
-            temperature=0.3,
-            max_tokens=20
-        )
-
-        title = response.choices[0].message.content.strip()
+        agent_token = current_agent.set("title")
+        try:
+            with span("title"):
+                completion = await complete(
+                    [
+                        {"role": "system", "content": prompt.system},
+                        {"role": "user", "content": content}
+                    ],
+                    model=prompt.model,
+                    temperature=prompt.temperature,
+                    max_tokens=prompt.max_tokens,
+                    timeout=TITLE_TIMEOUT,
+                    priority=BACKGROUND
+                )
+        finally:
+            current_agent.reset(agent_token)
+
+        title = completion.text.strip()
         # Remove quotes if present
         title = title.strip('"\'')
         # Limit length
@@ -112,6 +153,6 @@ Examples:
         return title
 
     except Exception as e:
-        print(f"[Title Generation Error]: {e}")
+        log_event("title_generation_error", logging.WARNING, error=str(e))
         # Fallback to simple title from user message
         return user_message[:50] + ("..." if len(user_message) > 50 else "")
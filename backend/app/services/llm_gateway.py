@@ -0,0 +1,574 @@
+import os
+import math
+import time
+import heapq
+import random
+import asyncio
+import logging
+import itertools
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+import httpx
+import openai
+from openai import AsyncOpenAI
+
+from app.services.telemetry import Counter, Gauge, Histogram, log_event, record_llm_call, record_stage, register_metric
+
+# OPENAI_BASE_URL points the client at a compatible server, e.g. benchmarks/mock_openai.py
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+
+# Connection pool shared by every LLM call
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+# HTTP/2 multiplexes concurrent calls over one connection (needs the `h2` package)
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "true").lower() == "true"
+
+# Seconds a whole call may take, retries included; connecting gets a much shorter limit
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+
+# Retries on 429, 5xx and connection errors, with full-jitter exponential backoff
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+
+# Hedging: if a non-streamed call is still running after the model's recent
+# p95 latency, send a duplicate and use whichever answers first
+LLM_HEDGE = os.getenv("LLM_HEDGE", "false").lower() == "true"
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+
+# Scheduling: bounded in-flight calls and OpenAI-style per-minute budgets (0 = unlimited)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_RPM_LIMIT = int(os.getenv("LLM_RPM_LIMIT", "0"))
+LLM_TPM_LIMIT = int(os.getenv("LLM_TPM_LIMIT", "0"))
+# Share of the concurrency limit background calls (titles, summaries) may occupy
+LLM_BACKGROUND_SHARE = float(os.getenv("LLM_BACKGROUND_SHARE", "0.5"))
+# Calls allowed to wait for a slot, and for how long, before they are shed
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "256"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "10"))
+LLM_BACKGROUND_QUEUE_TIMEOUT = float(os.getenv("LLM_BACKGROUND_QUEUE_TIMEOUT", "60"))
+# Completion size assumed for the token budget when a call sets no max_tokens
+LLM_EXPECTED_COMPLETION_TOKENS = int(os.getenv("LLM_EXPECTED_COMPLETION_TOKENS", "300"))
+
+# Call priorities: lower runs first
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+# Priority of calls that don't pass one, e.g. BACKGROUND for a whole batch job
+llm_priority: ContextVar[int] = ContextVar("llm_priority", default=INTERACTIVE)
+
+LLM_RETRIES = Counter("voxai_llm_retries_total", "LLM call attempts retried", ("reason",))
+LLM_HEDGES = Counter("voxai_llm_hedges_total", "Hedged LLM requests sent and which attempt won", ("outcome",))
+LLM_ERRORS = Counter("voxai_llm_errors_total", "LLM calls that failed after retries", ("kind",))
+LLM_QUEUE_DEPTH = Gauge("voxai_llm_queue_depth", "LLM calls waiting for the scheduler", ("priority",))
+LLM_IN_FLIGHT = Gauge("voxai_llm_in_flight", "LLM calls currently running", ("priority",))
+LLM_QUEUE_SECONDS = Histogram("voxai_llm_queue_wait_seconds", "Time LLM calls waited for the scheduler", ("priority",))
+LLM_SHED = Counter("voxai_llm_shed_total", "LLM calls rejected by the scheduler", ("priority", "reason"))
+for metric in (LLM_RETRIES, LLM_HEDGES, LLM_ERRORS, LLM_QUEUE_DEPTH, LLM_IN_FLIGHT, LLM_QUEUE_SECONDS, LLM_SHED):
+    register_metric(metric)
+
+
+# ============== Errors ==============
+
+class LLMError(Exception):
+    """An LLM call failed; `kind` says how, so callers can react without parsing messages."""
+
+    kind = "error"
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class LLMTimeoutError(LLMError):
+    """The call's deadline passed."""
+
+    kind = "timeout"
+
+
+class LLMRateLimitError(LLMError):
+    """Still rate limited (429) after retrying."""
+
+    kind = "rate_limited"
+
+
+class LLMUnavailableError(LLMError):
+    """The API kept failing with 5xx or connection errors."""
+
+    kind = "unavailable"
+
+
+class LLMOverloadedError(LLMError):
+    """Shed by the scheduler: its queue was full or the call waited too long for a slot."""
+
+    kind = "overloaded"
+
+
+class LLMRequestError(LLMError):
+    """The API rejected the request (bad request, authentication, ...); retrying won't help."""
+
+    kind = "rejected"
+
+
+def translate_error(e: Exception) -> LLMError:
+    """Map an OpenAI SDK exception onto an LLMError."""
+    if isinstance(e, LLMError):
+        return e
+    if isinstance(e, (openai.APITimeoutError, asyncio.TimeoutError)):
+        return LLMTimeoutError("The language model took too long to respond")
+    if isinstance(e, openai.RateLimitError):
+        return LLMRateLimitError(str(e), 429)
+    if isinstance(e, openai.APIConnectionError):
+        return LLMUnavailableError(str(e))
+    if isinstance(e, openai.APIStatusError):
+        if e.status_code >= 500:
+            return LLMUnavailableError(str(e), e.status_code)
+        return LLMRequestError(str(e), e.status_code)
+    return LLMError(str(e))
+
+
+def is_retryable(e: LLMError) -> bool:
+    return isinstance(e, (LLMRateLimitError, LLMUnavailableError))
+
+
+def retry_delay(attempt: int, e: Exception) -> float:
+    """Full-jitter exponential backoff, or the server's Retry-After when it sent one."""
+    response = getattr(e, "response", None)
+    if response is not None:
+        try:
+            return min(float(response.headers["retry-after"]), LLM_RETRY_MAX_DELAY)
+        except (KeyError, ValueError):
+            pass
+    return random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** attempt))
+
+
+# ============== Client ==============
+
+def http2_available() -> bool:
+    if not LLM_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        log_event("llm_http2_unavailable", logging.WARNING, fallback="HTTP/1.1 keep-alive")
+        return False
+
+
+def create_client() -> AsyncOpenAI:
+    """OpenAI client on a tuned, shared httpx pool; retries are handled here, not by the SDK."""
+    http_client = httpx.AsyncClient(
+        http2=http2_available(),
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+    )
+    return AsyncOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        base_url=OPENAI_BASE_URL,
+        http_client=http_client,
+        max_retries=0
+    )
+
+
+client = create_client()
+
+
+class LatencyTracker:
+    """Recent successful call latencies per model, for the hedging delay."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self.samples: Dict[str, Deque[float]] = {}
+
+    def observe(self, model: str, seconds: float) -> None:
+        self.samples.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def quantile(self, model: str, q: float) -> Optional[float]:
+        samples = self.samples.get(model)
+        if not samples or len(samples) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+latencies = LatencyTracker()
+
+
+@dataclass
+class Completion:
+    text: str
+    usage: Any = None
+
+
+# ============== Scheduling ==============
+
+class TokenBucket:
+    """Continuously refilled budget of `per_minute` units (<= 0 means unlimited)."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` is available; an amount above capacity waits for a full bucket."""
+        if self.capacity <= 0:
+            return 0.0
+        self.refill()
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount: float) -> None:
+        """Spend (or, if negative, refund) units; the level may go below zero."""
+        if self.capacity > 0:
+            self.refill()
+            self.level = min(self.capacity, self.level - amount)
+
+
+@dataclass(order=True)
+class Waiter:
+    priority: int
+    seq: int
+    tokens: int = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+class LLMScheduler:
+    """
+    Admission control for outbound LLM calls.
+
+    A call starts when a concurrency slot is free and the requests-per-minute
+    and tokens-per-minute buckets can cover it (tokens are estimated up front
+    and reconciled with the reported usage afterwards). Otherwise it waits in
+    a priority queue: interactive calls always go before background ones, and
+    background calls only get LLM_BACKGROUND_SHARE of the slots. Calls are
+    shed with LLMOverloadedError when the queue is full or their wait times out.
+    """
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, rpm: int = LLM_RPM_LIMIT,
+                 tpm: int = LLM_TPM_LIMIT, max_queue: int = LLM_MAX_QUEUE,
+                 background_share: float = LLM_BACKGROUND_SHARE):
+        self.max_concurrency = max_concurrency
+        self.background_slots = max(1, int(max_concurrency * background_share))
+        self.max_queue = max_queue
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.waiters: List[Waiter] = []
+        self.in_flight = {INTERACTIVE: 0, BACKGROUND: 0}
+        self.seq = itertools.count()
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.started = 0
+        self.shed = 0
+
+    def start_delay(self, priority: int, tokens: int) -> float:
+        """Seconds until a call could start (inf while it's waiting for a slot)."""
+        if sum(self.in_flight.values()) >= self.max_concurrency:
+            return math.inf
+        if priority == BACKGROUND and self.in_flight[BACKGROUND] >= self.background_slots:
+            return math.inf
+        return max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+    def start(self, priority: int, tokens: int) -> None:
+        self.in_flight[priority] += 1
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        self.started += 1
+
+    def try_acquire(self, tokens: int, priority: int = INTERACTIVE) -> bool:
+        """Start a call only if it needn't wait (and nothing is queued ahead of it)."""
+        if self.waiters or self.start_delay(priority, tokens) > 0:
+            return False
+        self.start(priority, tokens)
+        self.update_gauges()
+        return True
+
+    async def acquire(self, tokens: int, priority: int = INTERACTIVE, timeout: float = LLM_QUEUE_TIMEOUT) -> float:
+        """
+        Wait for permission to start a call; pair with release().
+
+        Returns:
+            Seconds spent waiting
+
+        Raises:
+            LLMOverloadedError: if the queue is full or `timeout` passes first
+        """
+        if self.try_acquire(tokens, priority):
+            return 0.0
+        if len(self.waiters) >= self.max_queue:
+            self.reject(priority, "queue_full")
+
+        started = time.monotonic()
+        waiter = Waiter(priority, next(self.seq), tokens, asyncio.get_running_loop().create_future())
+        heapq.heappush(self.waiters, waiter)
+        self.dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except asyncio.TimeoutError:
+            self.abandon(waiter)
+            self.reject(priority, "timeout")
+        except asyncio.CancelledError:
+            self.abandon(waiter)
+            raise
+
+        waited = time.monotonic() - started
+        LLM_QUEUE_SECONDS.observe(waited, PRIORITY_NAMES[priority])
+        record_stage("llm_queue", waited)
+        return waited
+
+    def abandon(self, waiter: Waiter) -> None:
+        """Withdraw a waiter whose caller gave up."""
+        if waiter.future.done():
+            # Granted just as the wait ended: hand the slot back
+            self.release(waiter.priority)
+            return
+        waiter.future.cancel()
+        self.waiters.remove(waiter)
+        heapq.heapify(self.waiters)
+        self.dispatch()
+
+    def release(self, priority: int, estimated: int = 0, actual: Optional[int] = None) -> None:
+        """Free a call's slot and correct the token budget with its reported usage."""
+        self.in_flight[priority] -= 1
+        if actual is not None:
+            self.tokens.take(actual - estimated)
+        self.dispatch()
+
+    def reject(self, priority: int, reason: str) -> None:
+        self.shed += 1
+        LLM_SHED.inc(1, PRIORITY_NAMES[priority], reason)
+        raise LLMOverloadedError(f"LLM scheduler shed the call ({reason})")
+
+    def dispatch(self) -> None:
+        """Start queued calls in priority order while capacity allows."""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        while self.waiters:
+            head = self.waiters[0]
+            delay = self.start_delay(head.priority, head.tokens)
+            if delay > 0:
+                if delay != math.inf:
+                    # Budget-limited: look again once the buckets have refilled
+                    self.timer = asyncio.get_running_loop().call_later(delay, self.dispatch)
+                break
+            heapq.heappop(self.waiters)
+            self.start(head.priority, head.tokens)
+            head.future.set_result(None)
+        self.update_gauges()
+
+    def update_gauges(self) -> None:
+        for priority, name in PRIORITY_NAMES.items():
+            LLM_QUEUE_DEPTH.set(sum(1 for w in self.waiters if w.priority == priority), name)
+            LLM_IN_FLIGHT.set(self.in_flight[priority], name)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": {PRIORITY_NAMES[p]: n for p, n in self.in_flight.items()},
+            "queued": len(self.waiters),
+            "started": self.started,
+            "shed": self.shed,
+            "rpm_limit": self.requests.capacity,
+            "tpm_limit": self.tokens.capacity
+        }
+
+
+scheduler = LLMScheduler()
+
+
+def estimate_tokens(messages: List[dict], max_tokens: Optional[int]) -> int:
+    """Rough prompt + completion size for the token budget (about 4 characters per token)."""
+    prompt = sum(len(str(message.get("content", ""))) for message in messages) // 4
+    return prompt + (max_tokens or LLM_EXPECTED_COMPLETION_TOKENS)
+
+
+def total_tokens(usage) -> Optional[int]:
+    return getattr(usage, "total_tokens", None) if usage is not None else None
+
+
+# ============== Calls ==============
+
+async def complete(
+    messages: List[dict],
+    model: str = "gpt-4o-mini",
+    temperature: float = 0.7,
+    max_tokens: Optional[int] = None,
+    on_token: Optional[Callable[[str], None]] = None,
+    timeout: float = LLM_TIMEOUT,
+    priority: Optional[int] = None
+) -> Completion:
+    """
+    Run a chat completion through the scheduler, with a deadline, retries
+    and (optionally) hedging.
+
+    Args:
+        messages: Chat messages, system prompt first
+        model: Model name
+        temperature: Sampling temperature
+        max_tokens: Optional completion limit
+        on_token: Stream the answer, calling this with each token as it arrives.
+            A streamed call is only retried until its first token was delivered.
+        timeout: Seconds the whole call may take, queueing and retries included
+        priority: INTERACTIVE for calls a user is waiting on, BACKGROUND otherwise
+            (default: the llm_priority context variable)
+
+    Returns:
+        The completion text and the usage reported by the API
+
+    Raises:
+        LLMError: one of its subclasses, once retries are exhausted
+    """
+    if priority is None:
+        priority = llm_priority.get()
+    deadline = time.monotonic() + timeout
+    queue_timeout = LLM_BACKGROUND_QUEUE_TIMEOUT if priority == BACKGROUND else LLM_QUEUE_TIMEOUT
+    estimated = estimate_tokens(messages, max_tokens)
+    started = time.perf_counter()
+    queued = 0.0
+    usage = None
+    try:
+        attempt = 0
+        while True:
+            streamed = [False]
+            try:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise LLMTimeoutError("The language model took too long to respond")
+                # Each attempt takes its own slot, so backing off doesn't hold one
+                queued += await scheduler.acquire(estimated, priority, min(queue_timeout, remaining))
+                attempt_started = time.perf_counter()
+                completion = None
+                try:
+                    remaining = deadline - time.monotonic()
+                    if on_token is not None:
+                        completion = await asyncio.wait_for(
+                            stream_once(messages, model, temperature, max_tokens, on_token, streamed), remaining
+                        )
+                    else:
+                        completion = await hedged(messages, model, temperature, max_tokens, remaining, estimated, priority)
+                finally:
+                    scheduler.release(priority, estimated, total_tokens(completion.usage if completion else None))
+                usage = completion.usage
+                latencies.observe(model, time.perf_counter() - attempt_started)
+                return completion
+            except Exception as e:
+                error = translate_error(e)
+                delay = retry_delay(attempt, e)
+                if (not is_retryable(error) or attempt >= LLM_MAX_RETRIES or streamed[0]
+                        or time.monotonic() + delay >= deadline):
+                    LLM_ERRORS.inc(1, error.kind)
+                    raise error from e
+                LLM_RETRIES.inc(1, error.kind)
+                log_event("llm_retry", logging.WARNING, model=model, attempt=attempt + 1,
+                          kind=error.kind, delay=round(delay, 2))
+                attempt += 1
+                await asyncio.sleep(delay)
+    finally:
+        # Queueing shows up as its own "llm_queue" stage
+        record_llm_call(model, time.perf_counter() - started - queued, usage)
+
+
+async def request_once(messages, model, temperature, max_tokens) -> Completion:
+    options = {"max_tokens": max_tokens} if max_tokens else {}
+    response = await client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        **options
+    )
+    return Completion(response.choices[0].message.content or "", response.usage)
+
+
+async def stream_once(messages, model, temperature, max_tokens, on_token, streamed: List[bool]) -> Completion:
+    options = {"max_tokens": max_tokens} if max_tokens else {}
+    response = await client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        stream=True,
+        stream_options={"include_usage": True},
+        **options
+    )
+    chunks = []
+    usage = None
+    async for chunk in response:
+        if chunk.usage is not None:
+            usage = chunk.usage
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            chunks.append(delta)
+            streamed[0] = True
+            on_token(delta)
+    return Completion("".join(chunks), usage)
+
+
+async def hedged(messages, model, temperature, max_tokens, timeout: float,
+                 estimated: int = 0, priority: int = INTERACTIVE) -> Completion:
+    """
+    One non-streamed request; with LLM_HEDGE, a duplicate is sent if the first
+    hasn't answered within the model's recent p95 latency and the loser is cancelled.
+    The duplicate needs a free scheduler slot; it never queues.
+    """
+    delay = latencies.quantile(model, LLM_HEDGE_QUANTILE) if LLM_HEDGE else None
+    if delay is None or delay >= timeout:
+        return await asyncio.wait_for(request_once(messages, model, temperature, max_tokens), timeout)
+
+    deadline = time.monotonic() + timeout
+    primary = asyncio.create_task(request_once(messages, model, temperature, max_tokens))
+    tasks = [primary]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        hedge_sent = not done and scheduler.try_acquire(estimated, priority)
+        if hedge_sent:
+            LLM_HEDGES.inc(1, "sent")
+            hedge = asyncio.create_task(request_once(messages, model, temperature, max_tokens))
+            hedge.add_done_callback(lambda task: release_hedge(task, priority, estimated))
+            tasks.append(hedge)
+
+        error: Optional[BaseException] = None
+        while tasks:
+            done, _ = await asyncio.wait(
+                tasks, timeout=max(deadline - time.monotonic(), 0), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                raise LLMTimeoutError("The language model took too long to respond")
+            for task in done:
+                tasks.remove(task)
+                if task.exception() is None:
+                    if hedge_sent:
+                        LLM_HEDGES.inc(1, "primary_won" if task is primary else "hedge_won")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def release_hedge(task: asyncio.Task, priority: int, estimated: int) -> None:
+    """Free the hedge's slot however it ended (a task cancelled before it ran skips its finally blocks)."""
+    usage = None
+    if not task.cancelled() and task.exception() is None:
+        usage = task.result().usage
+    scheduler.release(priority, estimated, total_tokens(usage))
+
+
+async def close_client() -> None:
+    """Close the pooled connections."""
+    await client.close()
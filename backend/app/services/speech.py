@@ -1,70 +1,231 @@
 import io
 import os
-import tempfile
+import json
+import asyncio
+import queue
+import threading
+import subprocess
+import wave
 import speech_recognition as sr
-from gtts import gTTS
-from fastapi import HTTPException
-from pydub import AudioSegment
+from typing import AsyncIterator, Dict, List, Optional
+from gtts import gTTS, gTTSError
+from gtts.lang import tts_langs
+from fastapi import HTTPException, UploadFile
+from app.services.workers import BoundedExecutor
+from app.services.telemetry import span
+from app.services.tts_cache import split_sentences
 
-recognizer = sr.Recognizer()
+# Decoding and STT run on a dedicated pool; requests beyond its queue get a 503
+speech_executor = BoundedExecutor(
+    "speech",
+    max_workers=int(os.getenv("SPEECH_WORKERS", "4")),
+    max_queue=int(os.getenv("SPEECH_MAX_QUEUE", "16")),
+    saturated_detail="Speech service is busy, please try again shortly."
+)
 
-# Supported input formats (pydub/ffmpeg supports many more)
+# Supported input formats (ffmpeg supports many more)
 SUPPORTED_FORMATS = [
     'webm', 'mp3', 'mp4', 'm4a', 'ogg', 'oga', 'flac', 'wav', 'aiff', 'aac', 'wma', 'opus'
 ]
 
+# Containers whose index may sit at the end of the file, so ffmpeg can't
+# decode them from a pipe and needs a seekable in-memory file instead
+SEEKABLE_FORMATS = ['mp4', 'm4a', 'mov', '3gp']
 
-def convert_to_wav(input_path: str) -> str:
+# Largest accepted voice upload
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_AUDIO_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+
+# PCM format fed to the recognizer: 16 kHz, 16-bit, mono
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def audio_format(filename: Optional[str]) -> str:
+    """Get the audio format from an upload's filename, defaulting to webm."""
+    ext = os.path.splitext(filename or "")[1].lower().lstrip('.')
+    return ext or "webm"
+
+
+async def read_audio_upload(audio: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> bytes:
+    """Read an uploaded audio file into memory, rejecting it if it exceeds max_bytes."""
+    too_large = HTTPException(
+        status_code=413,
+        detail=f"Audio file too large. Maximum size is {max_bytes // (1024 * 1024)} MB."
+    )
+    if audio.size is not None and audio.size > max_bytes:
+        raise too_large
+
+    buffer = bytearray()
+    while chunk := await audio.read(UPLOAD_CHUNK_SIZE):
+        buffer += chunk
+        if len(buffer) > max_bytes:
+            raise too_large
+    return bytes(buffer)
+
+
+def decode_audio(data: bytes, fmt: str) -> sr.AudioData:
     """
-    Convert any audio file to WAV format for speech recognition.
+    Decode any audio format to 16 kHz mono PCM for speech recognition.
     Supports: webm, mp3, mp4, m4a, ogg, flac, wav, aiff, aac, wma, opus, etc.
+
+    The audio is piped through ffmpeg (stdin -> stdout), so nothing is written to disk.
     """
+    memfd = None
     try:
-        # Get file extension
-        ext = os.path.splitext(input_path)[1].lower().lstrip('.')
-
-        # pydub auto-detects format, but we can help it for some formats
-        if ext in ['webm', 'ogg', 'opus']:
-            audio = AudioSegment.from_file(input_path, format=ext)
-        elif ext == 'm4a':
-            audio = AudioSegment.from_file(input_path, format='m4a')
-        elif ext == 'mp4':
-            audio = AudioSegment.from_file(input_path, format='mp4')
+        if fmt in SEEKABLE_FORMATS and hasattr(os, "memfd_create"):
+            memfd = os.memfd_create("voice-upload")
+            os.write(memfd, data)
+            source, stdin_data, stdin = f"/proc/self/fd/{memfd}", None, subprocess.DEVNULL
         else:
-            # Let pydub auto-detect
-            audio = AudioSegment.from_file(input_path)
-
-        # Convert to mono and set sample rate for better recognition
-        audio = audio.set_channels(1).set_frame_rate(16000)
+            source, stdin_data, stdin = "pipe:0", data, None
 
-        # Export as WAV
-        wav_path = tempfile.mktemp(suffix='.wav')
-        audio.export(wav_path, format='wav')
-        return wav_path
+        result = subprocess.run(
+            [
+                "ffmpeg", "-hide_banner", "-loglevel", "error",
+                "-i", source,
+                "-f", "s16le", "-acodec", "pcm_s16le",
+                "-ac", "1", "-ar", str(SAMPLE_RATE),
+                "pipe:1"
+            ],
+            input=stdin_data,
+            stdin=stdin,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            pass_fds=(memfd,) if memfd is not None else (),
+            check=True
+        )
+        return sr.AudioData(result.stdout, SAMPLE_RATE, SAMPLE_WIDTH)
 
+    except subprocess.CalledProcessError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Audio conversion failed. Error: {e.stderr.decode(errors='replace').strip()}"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=400,
             detail=f"Audio conversion failed. Ensure ffmpeg is installed. Error: {str(e)}"
         )
+    finally:
+        if memfd is not None:
+            os.close(memfd)
 
 
-def transcribe_audio(audio_file_path: str) -> str:
+class SpeechToText:
     """
-    Transcribe audio file to text using Google Speech Recognition.
-    Automatically converts any audio format to WAV first.
+    Speech-to-text engine interface.
+
+    Engines are created once per worker process; `load` is called at startup
+    so models are warm before the first request.
     """
-    wav_path = None
-    try:
-        # Convert to WAV format
-        wav_path = convert_to_wav(audio_file_path)
 
-        with sr.AudioFile(wav_path) as source:
-            # Adjust for ambient noise
-            recognizer.adjust_for_ambient_noise(source, duration=0.2)
-            audio = recognizer.record(source)
+    name = "base"
+
+    def load(self) -> None:
+        """Load models or other expensive resources."""
+
+    def transcribe(self, audio: sr.AudioData) -> str:
+        """
+        Transcribe 16 kHz mono PCM audio.
+
+        Raises:
+            sr.UnknownValueError: if no speech could be recognized
+            sr.RequestError: if the engine itself failed
+        """
+        raise NotImplementedError
+
+
+class GoogleSpeechToText(SpeechToText):
+    """Google Web Speech API via SpeechRecognition (network call)."""
+
+    name = "google"
+
+    def __init__(self):
+        self.recognizer = sr.Recognizer()
+
+    def transcribe(self, audio: sr.AudioData) -> str:
+        return self.recognizer.recognize_google(audio)
+
+
+class VoskSpeechToText(SpeechToText):
+    """
+    Offline CPU recognition with Vosk (Kaldi).
+
+    The model is loaded once and shared; recognizers are kept in a pool and
+    reused across requests instead of being rebuilt per call.
+    """
+
+    name = "vosk"
+
+    def __init__(self, model_path: Optional[str] = None):
+        self.model_path = model_path or os.getenv("VOSK_MODEL_PATH", "models/vosk")
+        self.model = None
+        self.recognizers: "queue.SimpleQueue" = queue.SimpleQueue()
+
+    def load(self) -> None:
+        if self.model is not None:
+            return
+        try:
+            import vosk
+        except ImportError:
+            raise RuntimeError("STT_ENGINE=vosk requires the 'vosk' package")
+        vosk.SetLogLevel(-1)
+        self.model = vosk.Model(self.model_path)
+
+    def transcribe(self, audio: sr.AudioData) -> str:
+        self.load()
+        import vosk
 
-        text = recognizer.recognize_google(audio)
+        try:
+            recognizer = self.recognizers.get_nowait()
+        except queue.Empty:
+            recognizer = vosk.KaldiRecognizer(self.model, SAMPLE_RATE)
+
+        try:
+            recognizer.AcceptWaveform(audio.get_raw_data(convert_rate=SAMPLE_RATE, convert_width=SAMPLE_WIDTH))
+            text = json.loads(recognizer.FinalResult()).get("text", "")
+        finally:
+            recognizer.Reset()
+            self.recognizers.put(recognizer)
+
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+
+STT_ENGINES = {
+    GoogleSpeechToText.name: GoogleSpeechToText,
+    VoskSpeechToText.name: VoskSpeechToText
+}
+
+STT_ENGINE = os.getenv("STT_ENGINE", "google")
+
+_stt_engines: Dict[str, SpeechToText] = {}
+
+
+def get_stt_engine(name: Optional[str] = None) -> SpeechToText:
+    """Get the (cached) STT engine by name, defaulting to STT_ENGINE."""
+    name = name or STT_ENGINE
+    if name not in _stt_engines:
+        if name not in STT_ENGINES:
+            raise ValueError(f"Unknown STT engine '{name}'. Available: {', '.join(STT_ENGINES)}")
+        _stt_engines[name] = STT_ENGINES[name]()
+    return _stt_engines[name]
+
+
+def recognize_audio(audio_bytes: bytes, fmt: str = "webm", engine: Optional[str] = None) -> str:
+    """
+    Transcribe audio to text with the configured STT engine.
+    Decodes any audio format to PCM in memory first. Blocking - see transcribe_audio.
+    """
+    try:
+        audio = decode_audio(audio_bytes, fmt)
+        if not audio.frame_data:
+            raise sr.UnknownValueError()
+
+        text = get_stt_engine(engine).transcribe(audio)
         return text
 
     except sr.UnknownValueError:
@@ -75,19 +236,299 @@ def transcribe_audio(audio_file_path: str) -> str:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Transcription error: {str(e)}")
-    finally:
-        # Cleanup converted file
-        if wav_path and os.path.exists(wav_path):
+
+
+async def transcribe_audio(audio_bytes: bytes, fmt: str = "webm", engine: Optional[str] = None) -> str:
+    """Transcribe audio on the speech worker pool, keeping the event loop free."""
+    with span("stt"):
+        return await speech_executor.run(recognize_audio, audio_bytes, fmt, engine)
+
+
+# ============== TEXT TO SPEECH ==============
+
+# Output codecs: media type and ffmpeg encoder arguments
+AUDIO_FORMATS = {
+    "mp3": ("audio/mpeg", ["-f", "mp3", "-codec:a", "libmp3lame", "-b:a", "64k"]),
+    "opus": ("audio/ogg; codecs=opus", ["-f", "ogg", "-codec:a", "libopus", "-b:a", "24k"]),
+    "pcm": ("audio/L16; rate=24000; channels=1", ["-f", "s16le", "-acodec", "pcm_s16le", "-ac", "1", "-ar", "24000"])
+}
+
+AUDIO_EXTENSIONS = {"mp3": "mp3", "opus": "ogg", "pcm": "pcm"}
+
+# Formats whose per-sentence clips can simply be concatenated into one stream
+STREAMABLE_FORMATS = ["mp3", "pcm"]
+
+# TTS gets its own pool so synthesis bursts can't starve transcription
+tts_executor = BoundedExecutor(
+    "tts",
+    max_workers=int(os.getenv("TTS_WORKERS", "2")),
+    max_queue=int(os.getenv("TTS_MAX_QUEUE", "16")),
+    saturated_detail="Speech synthesis is busy, please try again shortly."
+)
+
+
+def transcode_audio(data: bytes, src_fmt: str, dst_fmt: str) -> bytes:
+    """Re-encode audio between formats by piping it through ffmpeg."""
+    if src_fmt == dst_fmt:
+        return data
+
+    input_args = ["-f", "s16le", "-ar", "24000", "-ac", "1"] if src_fmt == "pcm" else []
+    try:
+        result = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-loglevel", "error", *input_args, "-i", "pipe:0",
+             *AUDIO_FORMATS[dst_fmt][1], "pipe:1"],
+            input=data,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True
+        )
+        return result.stdout
+    except subprocess.CalledProcessError as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Audio encoding failed. Error: {e.stderr.decode(errors='replace').strip()}"
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Audio encoding failed. Ensure ffmpeg is installed. Error: {str(e)}"
+        )
+
+
+class TextToSpeech:
+    """
+    Text-to-speech engine interface.
+
+    Engines are created once per worker process and loaded at startup.
+    `synthesize` returns audio in the engine's `native_format`.
+    """
+
+    name = "base"
+    native_format = "mp3"
+
+    def load(self) -> None:
+        """Load models or other expensive resources."""
+
+    def validate(self, lang: str, voice: Optional[str] = None) -> None:
+        """Raise ValueError if this engine can't speak `lang` with `voice`."""
+
+    def synthesize(self, text: str, lang: str = "en", voice: Optional[str] = None) -> bytes:
+        raise NotImplementedError
+
+
+# Google domains gTTS may use as an accent; `voice` picks the host the text is sent to,
+# so nothing outside this list is ever accepted
+GTTS_VOICES = [
+    "com", "co.uk", "com.au", "ca", "co.in", "ie", "co.za", "com.ng",
+    "fr", "com.br", "pt", "com.mx", "es"
+]
+
+
+class GTTSTextToSpeech(TextToSpeech):
+    """
+    Google Translate TTS via gTTS (network call per text chunk).
+
+    `voice` selects the accent via its Google domain (e.g. "co.uk", "com.au").
+    """
+
+    name = "gtts"
+    native_format = "mp3"
+
+    def __init__(self):
+        self.languages = tts_langs()
+
+    def validate(self, lang: str, voice: Optional[str] = None) -> None:
+        if lang not in self.languages:
+            raise ValueError(f"Unsupported language '{lang}'")
+        if voice is not None and voice not in GTTS_VOICES:
+            raise ValueError(f"Unknown voice '{voice}'. Available: {', '.join(GTTS_VOICES)}")
+
+    def synthesize(self, text: str, lang: str = "en", voice: Optional[str] = None) -> bytes:
+        tts = gTTS(text=text, lang=lang, tld=voice or "com")
+        audio_buffer = io.BytesIO()
+        tts.write_to_fp(audio_buffer)
+        return audio_buffer.getvalue()
+
+
+class PiperTextToSpeech(TextToSpeech):
+    """
+    Offline CPU synthesis with Piper (ONNX voices).
+
+    `voice` names a model in PIPER_VOICES_DIR (e.g. "en_US-lessac-medium");
+    the name's locale prefix is the language it speaks.
+    Each voice is loaded once and shared by the TTS pool threads, since
+    ONNX Runtime sessions are safe to run concurrently.
+    """
+
+    name = "piper"
+    native_format = "wav"
+
+    def __init__(self, voices_dir: Optional[str] = None, default_voice: Optional[str] = None):
+        self.voices_dir = voices_dir or os.getenv("PIPER_VOICES_DIR", "models/piper")
+        self.default_voice = default_voice or os.getenv("PIPER_VOICE", "en_US-lessac-medium")
+        self.voices = {}
+        self.lock = threading.Lock()
+
+    def get_voice(self, name: Optional[str] = None):
+        name = name or self.default_voice
+        if name not in self.voices:
             try:
-                os.unlink(wav_path)
-            except:
-                pass
-
-
-def text_to_speech(text: str) -> io.BytesIO:
-    """Convert text to speech and return audio bytes."""
-    tts = gTTS(text=text, lang="en")
-    audio_buffer = io.BytesIO()
-    tts.write_to_fp(audio_buffer)
-    audio_buffer.seek(0)
-    return audio_buffer
+                from piper import PiperVoice
+            except ImportError:
+                raise RuntimeError("TTS_ENGINE=piper requires the 'piper-tts' package")
+            with self.lock:
+                if name not in self.voices:
+                    model_path = os.path.join(self.voices_dir, f"{os.path.basename(name)}.onnx")
+                    self.voices[name] = PiperVoice.load(model_path)
+        return self.voices[name]
+
+    def load(self) -> None:
+        self.get_voice()
+
+    def available_voices(self) -> List[str]:
+        """Names of the voice models in voices_dir."""
+        try:
+            names = os.listdir(self.voices_dir)
+        except FileNotFoundError:
+            return []
+        return [name[:-len(".onnx")] for name in names if name.endswith(".onnx")]
+
+    def validate(self, lang: str, voice: Optional[str] = None) -> None:
+        voice = voice or self.default_voice
+        if voice not in self.available_voices():
+            raise ValueError(f"Unknown voice '{voice}'")
+        # "en_US-lessac-medium" speaks "en_US", which also matches "en" and "en-US"
+        locale = voice.split("-")[0].lower()
+        requested = lang.replace("-", "_").lower()
+        if requested not in (locale, locale.split("_")[0]):
+            raise ValueError(f"Voice '{voice}' does not speak '{lang}'")
+
+    def synthesize(self, text: str, lang: str = "en", voice: Optional[str] = None) -> bytes:
+        piper_voice = self.get_voice(voice)
+        audio_buffer = io.BytesIO()
+        with wave.open(audio_buffer, "wb") as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(piper_voice.config.sample_rate)
+            for chunk in piper_voice.synthesize_stream_raw(text):
+                wav_file.writeframes(chunk)
+        return audio_buffer.getvalue()
+
+
+TTS_ENGINES = {
+    GTTSTextToSpeech.name: GTTSTextToSpeech,
+    PiperTextToSpeech.name: PiperTextToSpeech
+}
+
+TTS_ENGINE = os.getenv("TTS_ENGINE", "gtts")
+
+_tts_engines: Dict[str, TextToSpeech] = {}
+
+
+def get_tts_engine(name: Optional[str] = None) -> TextToSpeech:
+    """Get the (cached) TTS engine by name, defaulting to TTS_ENGINE."""
+    name = name or TTS_ENGINE
+    if name not in _tts_engines:
+        if name not in TTS_ENGINES:
+            raise ValueError(f"Unknown TTS engine '{name}'. Available: {', '.join(TTS_ENGINES)}")
+        _tts_engines[name] = TTS_ENGINES[name]()
+    return _tts_engines[name]
+
+
+def validate_speech_options(lang: str, voice: Optional[str] = None) -> None:
+    """Reject a language or voice the configured TTS engine doesn't offer with a 400."""
+    try:
+        get_tts_engine().validate(lang, voice)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def synthesize_speech(text: str, lang: str = "en", voice: Optional[str] = None, fmt: str = "mp3") -> bytes:
+    """Convert text to speech in the requested format. Blocking - see text_to_speech."""
+    try:
+        engine = get_tts_engine()
+        audio = engine.synthesize(text, lang, voice)
+        return transcode_audio(audio, engine.native_format, fmt)
+    except gTTSError as e:
+        raise HTTPException(status_code=502, detail=f"Speech synthesis service error: {str(e)}")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Speech synthesis error: {str(e)}")
+
+
+async def text_to_speech(text: str, lang: str = "en", voice: Optional[str] = None, fmt: str = "mp3") -> bytes:
+    """Convert text to speech on the TTS worker pool."""
+    with span("tts"):
+        return await tts_executor.run(synthesize_speech, text, lang, voice, fmt)
+
+
+async def stream_speech(
+    text: str,
+    lang: str = "en",
+    voice: Optional[str] = None,
+    fmt: str = "mp3"
+) -> AsyncIterator[bytes]:
+    """
+    Synthesize text sentence by sentence, yielding each sentence's audio as soon as it is ready.
+
+    The next sentence is synthesized while the current one is being sent, so
+    playback can start after the first sentence instead of the whole text.
+    Formats that can't be concatenated (see STREAMABLE_FORMATS) are
+    synthesized in one piece.
+    """
+    sentences = split_sentences(text) if fmt in STREAMABLE_FORMATS else [text]
+    if not sentences:
+        return
+
+    next_job = asyncio.ensure_future(text_to_speech(sentences[0], lang, voice, fmt))
+    try:
+        for i in range(len(sentences)):
+            job = next_job
+            if i + 1 < len(sentences):
+                next_job = asyncio.ensure_future(text_to_speech(sentences[i + 1], lang, voice, fmt))
+            yield await job
+    finally:
+        if not next_job.done():
+            next_job.cancel()
+
+
+async def start_speech(
+    text: str,
+    lang: str = "en",
+    voice: Optional[str] = None,
+    fmt: str = "mp3"
+) -> AsyncIterator[bytes]:
+    """
+    Like stream_speech, but waits for the first sentence before returning.
+
+    Called before the response is built, so a failed synthesis still maps to
+    its HTTP status instead of a 200 with a truncated body.
+
+    Raises:
+        HTTPException: if the first sentence could not be synthesized
+    """
+    chunks = stream_speech(text, lang, voice, fmt)
+    try:
+        first = await anext(chunks)
+    except StopAsyncIteration:
+        first = b""
+    except BaseException:
+        await chunks.aclose()
+        raise
+
+    async def remaining() -> AsyncIterator[bytes]:
+        try:
+            yield first
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            await chunks.aclose()
+
+    return remaining()
+
+
+def warm_up_speech() -> None:
+    """Load the configured STT and TTS engines so the first request doesn't pay for it."""
+    get_stt_engine().load()
+    get_tts_engine().load()
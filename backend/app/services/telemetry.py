@@ -0,0 +1,383 @@
+import os
+import sys
+import json
+import time
+import queue
+import logging
+import threading
+import logging.handlers
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# Seconds; covers a ~1 ms DB query up to a slow multi-call agent answer
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+# ============== Structured Logging ==============
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, event name and its fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "event": record.getMessage()
+        }
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry, default=str)
+
+
+def create_logger() -> Tuple[logging.Logger, logging.handlers.QueueListener]:
+    """
+    Logger whose records are formatted and written by a background thread,
+    so logging never blocks the event loop on stderr.
+    """
+    records: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter())
+    listener = logging.handlers.QueueListener(records, handler)
+
+    log = logging.getLogger("voxai")
+    log.setLevel(LOG_LEVEL)
+    log.propagate = False
+    log.addHandler(logging.handlers.QueueHandler(records))
+    listener.start()
+    return log, listener
+
+
+def log_event(event: str, level: int = logging.INFO, **fields) -> None:
+    """Log a structured event, e.g. log_event("query", question=q)."""
+    if logger.isEnabledFor(level):
+        # The trace id is captured now; the listener thread has no request context
+        trace = current_trace.get()
+        if trace is not None:
+            fields.setdefault("trace_id", trace.trace_id)
+        logger.log(level, event, extra={"fields": fields})
+
+
+# ============== Metrics ==============
+
+class Histogram:
+    """Prometheus-style cumulative histogram with optional labels."""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        # labels -> (per-bucket counts, sum, count)
+        self.series: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.setdefault(labels, [[0] * (len(self.buckets) + 1), 0.0, 0])
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for labels, (counts, total, count) in sorted(self.series.items()):
+                base = format_labels(self.labelnames, labels)
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{self.name}_bucket{format_labels(self.labelnames, labels, le=bound)} {cumulative}')
+                lines.append(f'{self.name}_bucket{format_labels(self.labelnames, labels, le="+Inf")} {count}')
+                lines.append(f"{self.name}_sum{base} {total}")
+                lines.append(f"{self.name}_count{base} {count}")
+        return lines
+
+
+class Counter:
+    """Prometheus-style monotonically increasing counter with optional labels."""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.lock = threading.Lock()
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, *labels: str) -> None:
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Gauge:
+    """Prometheus-style gauge: a value that goes up and down, with optional labels."""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.lock = threading.Lock()
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, *labels: str) -> None:
+        with self.lock:
+            self.values[labels] = value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+def format_labels(names: Tuple[str, ...], values: Tuple[str, ...], le=None) -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def escape_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUEST_SECONDS = Histogram(
+    "voxai_request_duration_seconds", "HTTP request latency", ("method", "route", "status")
+)
+STAGE_SECONDS = Histogram(
+    "voxai_stage_duration_seconds",
+    "Time spent per pipeline stage (router, specialist, llm, stt, tts, db, title)",
+    ("stage",)
+)
+LLM_CALL_SECONDS = Histogram(
+    "voxai_llm_call_duration_seconds", "Latency of individual LLM calls", ("agent", "model")
+)
+LLM_TOKENS = Counter(
+    "voxai_llm_tokens_total",
+    "Tokens reported in OpenAI usage (kind: prompt, cached_prompt or completion)",
+    ("agent", "model", "kind")
+)
+
+metrics: List = [REQUEST_SECONDS, STAGE_SECONDS, LLM_CALL_SECONDS, LLM_TOKENS]
+
+
+def register_metric(metric) -> None:
+    """Expose an additional Histogram/Counter (or any object with render()) on /metrics."""
+    metrics.append(metric)
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines: List[str] = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ============== Request Traces ==============
+
+@dataclass
+class Trace:
+    """Timings and token usage collected while serving one request."""
+
+    trace_id: str
+    started: float = field(default_factory=time.perf_counter)
+    # stage -> (total seconds, number of spans)
+    stages: Dict[str, List[float]] = field(default_factory=dict)
+    prompt_tokens: int = 0
+    # Prompt tokens the provider served from its prompt cache
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+
+    def add(self, stage: str, seconds: float) -> None:
+        totals = self.stages.setdefault(stage, [0.0, 0])
+        totals[0] += seconds
+        totals[1] += 1
+
+    def server_timing(self) -> str:
+        """Server-Timing header value for the stages recorded so far."""
+        parts = [
+            f'{stage};dur={seconds * 1000:.1f}' + (f';desc="{int(count)} calls"' if count > 1 else "")
+            for stage, (seconds, count) in self.stages.items()
+        ]
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "stages_ms": {stage: round(seconds * 1000, 1) for stage, (seconds, _) in self.stages.items()},
+            "llm_calls": int(self.stages.get("llm", [0, 0])[1]),
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "completion_tokens": self.completion_tokens
+        }
+
+
+current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+# Pipeline node currently running, used to label LLM calls
+current_agent: ContextVar[str] = ContextVar("current_agent", default="none")
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Add time spent in a stage to the current trace and the stage histogram."""
+    STAGE_SECONDS.observe(seconds, stage)
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time the enclosed block as `stage` (works around awaits too)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+def record_llm_call(model: str, seconds: float, usage=None) -> None:
+    """Record one LLM call's latency and the token counts from its `usage` field."""
+    agent = current_agent.get()
+    LLM_CALL_SECONDS.observe(seconds, agent, model)
+    record_stage("llm", seconds)
+    if usage is None:
+        return
+
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    cached_tokens = cached_prompt_tokens(usage)
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    LLM_TOKENS.inc(prompt_tokens, agent, model, "prompt")
+    LLM_TOKENS.inc(cached_tokens, agent, model, "cached_prompt")
+    LLM_TOKENS.inc(completion_tokens, agent, model, "completion")
+    trace = current_trace.get()
+    if trace is not None:
+        trace.prompt_tokens += prompt_tokens
+        trace.cached_tokens += cached_tokens
+        trace.completion_tokens += completion_tokens
+
+
+def cached_prompt_tokens(usage) -> int:
+    """
+    usage.prompt_tokens_details.cached_tokens, which is 0 when nothing was
+    cached and missing for providers that don't report it. Older openai
+    clients leave the details as a plain dict.
+    """
+    details = getattr(usage, "prompt_tokens_details", None)
+    if isinstance(details, dict):
+        return details.get("cached_tokens") or 0
+    return getattr(details, "cached_tokens", 0) or 0
+
+
+def get_prompt_cache_stats() -> Dict[str, Any]:
+    """Prompt tokens and the share served from the provider's prompt cache, per agent."""
+    totals: Dict[str, Dict[str, float]] = {}
+    with LLM_TOKENS.lock:
+        for (agent, _, kind), value in LLM_TOKENS.values.items():
+            agent_totals = totals.setdefault(agent, {"prompt": 0, "cached_prompt": 0})
+            if kind in agent_totals:
+                agent_totals[kind] += value
+
+    def summarize(prompt: float, cached: float) -> Dict[str, Any]:
+        return {
+            "prompt_tokens": int(prompt),
+            "cached_tokens": int(cached),
+            "cached_ratio": round(cached / prompt, 3) if prompt else 0.0
+        }
+
+    return {
+        **summarize(
+            sum(agent_totals["prompt"] for agent_totals in totals.values()),
+            sum(agent_totals["cached_prompt"] for agent_totals in totals.values())
+        ),
+        "by_agent": {
+            agent: summarize(agent_totals["prompt"], agent_totals["cached_prompt"])
+            for agent, agent_totals in sorted(totals.items())
+        }
+    }
+
+
+def instrument_engine(sync_engine) -> None:
+    """Count time spent in SQL statements as the "db" stage."""
+    from sqlalchemy import event
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        record_stage("db", time.perf_counter() - conn.info["query_started"].pop())
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_started"):
+            conn.info["query_started"].pop()
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware giving every HTTP request a Trace.
+
+    Adds a Server-Timing header with the stages finished before the response
+    starts (for streamed responses that's only what preceded the first
+    byte), then records the request histogram and logs the full trace,
+    including background tasks, once the request is done.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.next_id = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        self.next_id += 1
+        trace = Trace(trace_id=f"{os.getpid():x}-{self.next_id:x}")
+        token = current_trace.set(trace)
+        status = {"code": 500}
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_trace.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            seconds = time.perf_counter() - trace.started
+            REQUEST_SECONDS.observe(seconds, scope["method"], path, str(status["code"]))
+            if path not in ("/metrics", "unmatched"):
+                log_event(
+                    "request",
+                    trace_id=trace.trace_id,
+                    method=scope["method"],
+                    route=path,
+                    status=status["code"],
+                    **trace.summary()
+                )
+
+
+logger, log_listener = create_logger()
@@ -0,0 +1,218 @@
+import os
+import re
+import uuid
+import asyncio
+import hashlib
+import json
+from collections import OrderedDict
+from typing import AsyncIterator, List, Optional, Tuple
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import FileResponse
+
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "./tts_cache")
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+
+def tts_cache_key(text: str, lang: str, voice: Optional[str], fmt: str = "mp3", engine: str = "gtts") -> str:
+    """Content address of a synthesized clip."""
+    return hashlib.sha256(json.dumps([text, lang, voice, fmt, engine]).encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """
+    Content-addressed cache of synthesized audio on disk.
+
+    Files are named by their cache key plus a format extension (the clip's
+    "audio id"); the least recently used ones (by
+    mtime, refreshed on every hit) are evicted once the directory exceeds
+    `max_bytes`.
+
+    The directory is scanned once at startup; after that this process tracks
+    clip sizes and LRU order in memory, and all disk I/O runs on worker
+    threads so the event loop never waits on the filesystem.
+    """
+
+    def __init__(self, directory: str = TTS_CACHE_DIR, max_bytes: int = TTS_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        # audio id -> size in bytes, least recently used first
+        self.sizes: "OrderedDict[str, int]" = OrderedDict()
+        self.total_bytes = 0
+        self.load_index()
+
+    def path(self, audio_id: str) -> str:
+        return os.path.join(self.directory, audio_id)
+
+    def load_index(self) -> None:
+        """Read the clips already on disk, oldest first."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, audio_id, size in sorted(entries):
+            self.sizes[audio_id] = size
+            self.total_bytes += size
+
+    def forget(self, audio_id: str) -> None:
+        size = self.sizes.pop(audio_id, None)
+        if size is not None:
+            self.total_bytes -= size
+
+    async def get(self, audio_id: str) -> Optional[str]:
+        """Path of the cached clip, or None. Marks the clip as recently used."""
+        path = self.path(audio_id)
+        try:
+            await asyncio.to_thread(os.utime, path)
+        except FileNotFoundError:
+            # Possibly evicted by another worker sharing the directory
+            self.forget(audio_id)
+            self.misses += 1
+            return None
+        if audio_id in self.sizes:
+            self.sizes.move_to_end(audio_id)
+        self.hits += 1
+        return path
+
+    async def store_stream(self, audio_id: str, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """
+        Pass audio chunks through while writing them to the cache.
+
+        The clip only becomes visible once the stream completes, so an
+        interrupted synthesis never leaves a truncated file behind.
+        """
+        tmp_path = f"{self.path(audio_id)}.{uuid.uuid4().hex}.tmp"
+        completed = False
+        f = await asyncio.to_thread(open, tmp_path, "wb")
+        try:
+            size = 0
+            async for chunk in chunks:
+                await asyncio.to_thread(f.write, chunk)
+                size += len(chunk)
+                yield chunk
+            await asyncio.to_thread(f.close)
+            await asyncio.to_thread(os.replace, tmp_path, self.path(audio_id))
+            completed = True
+            self.forget(audio_id)
+            self.sizes[audio_id] = size
+            self.total_bytes += size
+            await self.evict()
+        finally:
+            if not completed:
+                await asyncio.to_thread(discard_file, f, tmp_path)
+
+    async def evict(self) -> None:
+        """Remove least recently used clips until the cache fits in max_bytes."""
+        victims = []
+        while self.total_bytes > self.max_bytes and self.sizes:
+            audio_id, size = self.sizes.popitem(last=False)
+            self.total_bytes -= size
+            victims.append(self.path(audio_id))
+        if victims:
+            await asyncio.to_thread(remove_files, victims)
+
+    def get_stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "clips": len(self.sizes),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes
+        }
+
+
+def discard_file(f, path: str) -> None:
+    """Close and delete a partially written clip."""
+    f.close()
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def remove_files(paths: List[str]) -> None:
+    for path in paths:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single "bytes=start-end" Range header.
+
+    Returns:
+        Inclusive (start, end), or None if the header isn't a byte range we serve
+
+    Raises:
+        HTTPException(416): if the range can't be satisfied
+    """
+    match = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", header)
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+
+    start, end = match.groups()
+    if start:
+        start, end = int(start), min(int(end) if end else size - 1, size - 1)
+    else:
+        # Suffix range: the last N bytes
+        start, end = max(size - int(end), 0), size - 1
+
+    if start > end or start >= size:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
+
+def read_range(path: str, start: int, end: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start + 1)
+
+
+async def cached_audio_response(request: Request, path: str, audio_id: str, media_type: str) -> Response:
+    """Serve a cached clip with ETag revalidation and single-range support."""
+    etag = f'"{audio_id}"'
+    headers = {"ETag": etag, "Accept-Ranges": "bytes", "Cache-Control": "private, max-age=86400"}
+
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    size = await asyncio.to_thread(os.path.getsize, path)
+    byte_range = parse_range(request.headers.get("range", ""), size)
+    if byte_range is None:
+        return FileResponse(path, media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    content = await asyncio.to_thread(read_range, path, start, end)
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return Response(content=content, status_code=206, media_type=media_type, headers=headers)
+
+
+def split_sentences(text: str, min_length: int = 40) -> List[str]:
+    """
+    Split text into sentence-sized chunks for incremental synthesis.
+    Very short sentences are merged into the next one to avoid tiny requests.
+    """
+    chunks = []
+    current = ""
+    for sentence in re.split(r"(?<=[.!?;:])\s+|\n+", text.strip()):
+        if not sentence.strip():
+            continue
+        current = f"{current} {sentence}".strip()
+        if len(current) >= min_length:
+            chunks.append(current)
+            current = ""
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+tts_cache = TTSCache()
@@ -0,0 +1,98 @@
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, Optional, TypeVar
+from fastapi import HTTPException
+
+T = TypeVar("T")
+
+
+class BoundedExecutor:
+    """
+    Thread pool for blocking work called from async handlers.
+
+    At most `max_workers` jobs run at once and at most `max_queue` more wait
+    for a worker; beyond that new jobs are rejected with `saturated_status`
+    instead of letting latency grow without bound. Queue wait and execution
+    time are tracked separately.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_workers: int,
+        max_queue: int,
+        saturated_status: int = 503,
+        saturated_detail: str = "Server is busy, please try again shortly.",
+        retry_after: Optional[int] = None
+    ):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.saturated_status = saturated_status
+        self.saturated_detail = saturated_detail
+        self.saturated_headers = {"Retry-After": str(retry_after)} if retry_after else None
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+
+        # Only touched from the event loop thread
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.exec_seconds_total = 0.0
+        self.exec_seconds_max = 0.0
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        """Run fn(*args) on the pool, raising HTTPException if the queue is full."""
+        if self.pending >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=self.saturated_status,
+                detail=self.saturated_detail,
+                headers=self.saturated_headers
+            )
+
+        timing = {"submitted": time.perf_counter()}
+
+        def job():
+            timing["started"] = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                timing["finished"] = time.perf_counter()
+
+        # pending drops when the job is done, not when the caller stops waiting:
+        # a cancelled request doesn't free the worker its job is still running on
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        future = self.executor.submit(job)
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self.finish, timing))
+        return await asyncio.wrap_future(future, loop=loop)
+
+    def finish(self, timing: Dict[str, float]) -> None:
+        self.pending -= 1
+        if "finished" in timing:
+            self.record(timing["started"] - timing["submitted"], timing["finished"] - timing["started"])
+
+    def record(self, wait_seconds: float, exec_seconds: float) -> None:
+        self.completed += 1
+        self.wait_seconds_total += wait_seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+        self.exec_seconds_total += exec_seconds
+        self.exec_seconds_max = max(self.exec_seconds_max, exec_seconds)
+
+    def get_stats(self) -> Dict[str, Any]:
+        completed = self.completed or 1
+        return {
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": min(self.pending, self.max_workers),
+            "queued": max(self.pending - self.max_workers, 0),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.wait_seconds_total / completed * 1000, 2),
+            "max_wait_ms": round(self.wait_seconds_max * 1000, 2),
+            "avg_exec_ms": round(self.exec_seconds_total / completed * 1000, 2),
+            "max_exec_ms": round(self.exec_seconds_max * 1000, 2)
+        }
@@ -0,0 +1,220 @@
+"""
+Offline load test of the question and session endpoints.
+
+Starts benchmarks/mock_openai.py and the API (via benchmarks/api_server.py,
+on a throwaway database, with OPENAI_BASE_URL pointing at the mock), signs
+up a user and then drives each endpoint in turn for --duration seconds
+with --clients concurrent clients:
+
+  text       POST /api/ask/text/detailed   (each client continues its own session)
+  voice      POST /api/ask/voice/detailed  (fixture audio, see --audio)
+  sessions   GET  /api/sessions
+  session    GET  /api/sessions/{id}?limit=50
+
+Reports requests/second and p50/p95/p99 latency per endpoint, plus the LLM
+calls and tokens the mock served. Pass --url to target a server you started
+yourself (then point its OPENAI_BASE_URL at a mock or at OpenAI).
+
+Usage (from backend/):
+    python -m benchmarks.api_load --clients 16 --duration 20 --latency-ms 400
+"""
+import io
+import os
+import sys
+import math
+import time
+import uuid
+import wave
+import struct
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.login_load import BACKEND_DIR, PASSWORD, free_port, wait_until_ready, percentile
+
+ENDPOINTS = ["text", "voice", "sessions", "session"]
+QUESTIONS = [
+    "Explain how vaccines train the immune system",
+    "Write a SQL query that finds duplicate emails",
+    "What is the integral of x squared",
+    "Help me plan a weekly workout routine",
+    "Rewrite this more formally: gonna be late today",
+    "Compare solar and wind power for a small farm",
+]
+
+
+def fixture_audio(seconds: float = 2.0, rate: int = 16000) -> bytes:
+    """A mono 16-bit WAV tone, long enough to exercise decoding like a short utterance."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(b"".join(
+            struct.pack("<h", int(8000 * math.sin(2 * math.pi * 220 * i / rate)))
+            for i in range(int(seconds * rate))
+        ))
+    return buffer.getvalue()
+
+
+def start_process(module: str, port: int, args: List[str], env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", module, "--port", str(port), *args],
+        cwd=BACKEND_DIR,
+        env={**os.environ, **env}
+    )
+
+
+class Results:
+    """Latencies and error counts per endpoint."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+
+    def record(self, endpoint: str, started: float, response: httpx.Response) -> None:
+        if response.is_success:
+            self.latencies[endpoint].append((time.perf_counter() - started) * 1000)
+        else:
+            self.errors[endpoint][response.status_code] += 1
+
+
+async def client_loop(client: httpx.AsyncClient, endpoint: str, headers: dict, shared_session: str,
+                      audio: bytes, audio_name: str, stop: float, results: Results, n: int) -> None:
+    session_id: Optional[str] = None
+    i = 0
+    while time.monotonic() < stop:
+        i += 1
+        started = time.perf_counter()
+        if endpoint == "text":
+            # Numbered so every question misses the response cache
+            question = f"{QUESTIONS[(n + i) % len(QUESTIONS)]} ({n}-{i})"
+            response = await client.post(
+                "/api/ask/text/detailed", json={"question": question, "session_id": session_id}, headers=headers
+            )
+            if response.is_success:
+                session_id = response.json()["session_id"]
+        elif endpoint == "voice":
+            data = {"session_id": session_id} if session_id else {}
+            response = await client.post(
+                "/api/ask/voice/detailed", files={"audio": (audio_name, audio)}, data=data, headers=headers
+            )
+            if response.is_success:
+                session_id = response.json()["session_id"]
+        elif endpoint == "sessions":
+            response = await client.get("/api/sessions", headers=headers)
+        else:
+            response = await client.get(f"/api/sessions/{shared_session}", params={"limit": 50}, headers=headers)
+        results.record(endpoint, started, response)
+
+
+async def run_endpoint(client, endpoint: str, headers: dict, shared_session: str,
+                       audio: bytes, audio_name: str, args) -> Results:
+    results = Results()
+    stop = time.monotonic() + args.duration
+    await asyncio.gather(*[
+        client_loop(client, endpoint, headers, shared_session, audio, audio_name, stop, results, n)
+        for n in range(args.clients)
+    ])
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Target a running server instead of starting the API and mock")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help=f"Comma-separated subset of {ENDPOINTS}")
+    parser.add_argument("--duration", type=float, default=15, help="Seconds per endpoint")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--audio", help="Audio file for voice requests (default: generated 2 s WAV tone)")
+    parser.add_argument("--latency-ms", type=float, default=400, help="Mock LLM median latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.4, help="Mock LLM log-normal spread")
+    parser.add_argument("--token-ms", type=float, default=5, help="Mock LLM delay per token")
+    parser.add_argument("--completion-tokens", type=int, default=120)
+    args = parser.parse_args()
+
+    endpoints = [name.strip() for name in args.endpoints.split(",") if name.strip()]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+    if args.audio:
+        with open(args.audio, "rb") as f:
+            audio, audio_name = f.read(), os.path.basename(args.audio)
+    else:
+        audio, audio_name = fixture_audio(), "fixture.wav"
+
+    processes = []
+    url = args.url
+    mock_url = None
+    if not url:
+        mock_port, api_port = free_port(), free_port()
+        mock_url = f"http://127.0.0.1:{mock_port}"
+        processes.append(start_process("benchmarks.mock_openai", mock_port, [
+            "--latency-ms", str(args.latency_ms),
+            "--latency-sigma", str(args.latency_sigma),
+            "--token-ms", str(args.token_ms),
+            "--completion-tokens", str(args.completion_tokens)
+        ], {}))
+        processes.append(start_process("benchmarks.api_server", api_port, [], {
+            "OPENAI_API_KEY": "benchmark",
+            "OPENAI_BASE_URL": f"{mock_url}/v1",
+            "DATABASE_URL": f"sqlite:///{tempfile.mkdtemp()}/api_bench.db"
+        }))
+        url = f"http://127.0.0.1:{api_port}"
+
+    report = {}
+    mock_stats = {}
+    limits = httpx.Limits(max_connections=args.clients + 4)
+    try:
+        async with httpx.AsyncClient(base_url=url, timeout=120, limits=limits) as client:
+            if mock_url:
+                async with httpx.AsyncClient(base_url=mock_url) as mock:
+                    await wait_until_ready(mock, path="/stats")
+            await wait_until_ready(client)
+
+            email = f"bench-{uuid.uuid4().hex[:8]}@example.com"
+            signup = await client.post("/api/auth/signup", json={"email": email, "username": "bench", "password": PASSWORD})
+            signup.raise_for_status()
+            headers = {"Authorization": f"Bearer {signup.json()['access_token']}"}
+
+            # A session with some history for the session page reads
+            shared_session = None
+            for question in QUESTIONS:
+                seed = await client.post(
+                    "/api/ask/text/detailed", json={"question": question, "session_id": shared_session}, headers=headers
+                )
+                seed.raise_for_status()
+                shared_session = seed.json()["session_id"]
+
+            for endpoint in endpoints:
+                report[endpoint] = await run_endpoint(client, endpoint, headers, shared_session, audio, audio_name, args)
+
+            if mock_url:
+                async with httpx.AsyncClient(base_url=mock_url) as mock:
+                    mock_stats = (await mock.get("/stats")).json()
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    print(f"\n{'endpoint':<12}{'ok':>8}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint, results in report.items():
+        samples = results.latencies[endpoint]
+        errors = sum(results.errors[endpoint].values())
+        print(f"{endpoint:<12}{len(samples):>8}{errors:>8}{len(samples) / args.duration:>9.1f}"
+              f"{percentile(samples, 50):>10.1f}{percentile(samples, 95):>10.1f}{percentile(samples, 99):>10.1f}")
+        if errors:
+            print(f"{'':<12}statuses: {dict(results.errors[endpoint])}")
+
+    if mock_stats:
+        print(f"\nmock LLM: {mock_stats['requests']} calls ({mock_stats['streamed']} streamed), "
+              f"{mock_stats['prompt_tokens']} prompt / {mock_stats['completion_tokens']} completion tokens")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
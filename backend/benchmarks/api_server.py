@@ -0,0 +1,62 @@
+"""
+Run the API under uvicorn for load tests.
+
+Unless STT_ENGINE is set, speech recognition uses a "fixture" engine that
+decodes the upload as usual but returns a canned question instead of
+calling Google, so voice endpoints can be benchmarked offline. Each
+transcript is numbered so answers aren't served from the response cache.
+
+Usage (from backend/):
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1 python -m benchmarks.api_server --port 8000
+"""
+import os
+import sys
+import argparse
+import itertools
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Read by app.services.speech at import time
+os.environ.setdefault("STT_ENGINE", "fixture")
+
+import speech_recognition as sr  # noqa: E402
+from app.services import speech  # noqa: E402
+
+FIXTURE_QUESTIONS = [
+    "What is the capital of Australia",
+    "Write a Python function that reverses a linked list",
+    "Plan a three day trip to Kyoto",
+    "What is 17 times 23",
+    "Fix the grammar in this sentence: me and him goes to school",
+    "Tell me a short story about a lighthouse keeper",
+]
+
+
+class FixtureSpeechToText(speech.SpeechToText):
+    """Returns canned questions for any non-empty audio."""
+
+    name = "fixture"
+
+    def __init__(self):
+        self.counter = itertools.count(1)
+
+    def transcribe(self, audio: sr.AudioData) -> str:
+        n = next(self.counter)
+        return f"{FIXTURE_QUESTIONS[n % len(FIXTURE_QUESTIONS)]} (voice {n})"
+
+
+speech.STT_ENGINES[FixtureSpeechToText.name] = FixtureSpeechToText
+
+
+def main():
+    import uvicorn
+    from app.main import app
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
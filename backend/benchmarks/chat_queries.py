@@ -0,0 +1,147 @@
+"""
+Benchmark the chat history queries on a large synthetic database.
+
+Builds a SQLite database with --messages chat messages (1M by default) and
+times the session list, a paginated session page and the agent history
+loader, first without and then with the composite indexes from
+app/migrations.py.
+
+Usage (from backend/):
+    python -m benchmarks.chat_queries --messages 1000000 --path /tmp/chat_bench.db
+"""
+import os
+import sys
+import time
+import uuid
+import random
+import sqlite3
+import asyncio
+import argparse
+import statistics
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def build_database(path: str, messages: int, messages_per_session: int, sessions_per_user: int) -> None:
+    """Create the schema with create_all and bulk-load synthetic rows with sqlite3."""
+    from sqlalchemy import create_engine
+    from app.database import Base
+    from app import models  # noqa: F401 - registers the tables
+
+    if os.path.exists(path):
+        os.remove(path)
+    Base.metadata.create_all(bind=create_engine(f"sqlite:///{path}"))
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    # Measure the "before" plan first; the migration adds the indexes back
+    conn.execute("DROP INDEX IF EXISTS ix_chat_messages_session_created")
+    conn.execute("DROP INDEX IF EXISTS ix_chat_sessions_user_updated")
+
+    session_count = max(messages // messages_per_session, 1)
+    user_count = max(session_count // sessions_per_user, 1)
+    start = datetime(2024, 1, 1)
+
+    users = [(str(uuid.uuid4()), f"user{i}@example.com", f"user{i}", "x", start, start) for i in range(user_count)]
+    conn.executemany("INSERT INTO users VALUES (?, ?, ?, ?, ?, ?)", users)
+
+    sessions = []
+    for i in range(session_count):
+        updated = start + timedelta(minutes=random.randrange(500000))
+        sessions.append((str(uuid.uuid4()), users[i % user_count][0], f"Session {i}", start, updated))
+    conn.executemany("INSERT INTO chat_sessions VALUES (?, ?, ?, ?, ?)", sessions)
+
+    # Interleave sessions the way real traffic does, so a session's rows aren't contiguous
+    batch = []
+    clock = start
+    for n in range(messages):
+        session_id = sessions[random.randrange(session_count)][0]
+        clock += timedelta(milliseconds=random.randrange(1, 2000))
+        role = "user" if n % 2 == 0 else "assistant"
+        batch.append((str(uuid.uuid4()), session_id, role, f"message {n} " * 8, None, None, None, clock))
+        if len(batch) == 50000:
+            conn.executemany("INSERT INTO chat_messages VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+            batch = []
+    if batch:
+        conn.executemany("INSERT INTO chat_messages VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+async def time_queries(SessionLocal, user_ids, session_ids, iterations: int) -> dict:
+    from app.services.chat import get_user_sessions, get_session_messages, get_session_history
+
+    cases = {
+        "list sessions": lambda db: get_user_sessions(db, random.choice(user_ids)),
+        "session page (limit 50)": lambda db: get_session_messages(db, random.choice(session_ids), 50),
+        "agent history (last 40)": lambda db: get_session_history(db, random.choice(session_ids)),
+    }
+    results = {}
+    async with SessionLocal() as db:
+        for name, case in cases.items():
+            samples = []
+            for _ in range(iterations):
+                started = time.perf_counter()
+                await case(db)
+                samples.append((time.perf_counter() - started) * 1000)
+                db.expunge_all()
+            results[name] = (statistics.median(samples), percentile(samples, 95))
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--messages-per-session", type=int, default=100)
+    parser.add_argument("--sessions-per-user", type=int, default=20)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--path", default="/tmp/voxai_chat_bench.db")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    build_database(args.path, args.messages, args.messages_per_session, args.sessions_per_user)
+    print(f"Built {args.messages:,} messages in {time.perf_counter() - started:.1f}s ({args.path})")
+
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    from app.database import create_engine_from_url
+    from app.migrations import run_migrations
+
+    engine = create_engine_from_url(f"sqlite:///{args.path}")
+    SessionLocal = async_sessionmaker(engine, expire_on_commit=False)
+    conn = sqlite3.connect(args.path)
+    user_ids = [row[0] for row in conn.execute("SELECT id FROM users")]
+    session_ids = [row[0] for row in conn.execute("SELECT id FROM chat_sessions")]
+
+    before = await time_queries(SessionLocal, user_ids, session_ids, args.iterations)
+    started = time.perf_counter()
+    await run_migrations(engine)
+    print(f"Migration took {time.perf_counter() - started:.1f}s")
+    conn.execute("ANALYZE")
+    conn.commit()
+    after = await time_queries(SessionLocal, user_ids, session_ids, args.iterations)
+
+    print(f"\n{'query':<26}{'p50 before':>12}{'p95 before':>12}{'p50 after':>12}{'p95 after':>12}  (ms)")
+    for name in before:
+        print(f"{name:<26}{before[name][0]:>12.2f}{before[name][1]:>12.2f}{after[name][0]:>12.2f}{after[name][1]:>12.2f}")
+
+    print("\nQuery plans with indexes:")
+    for sql in (
+        "SELECT * FROM chat_sessions WHERE user_id = ? ORDER BY updated_at DESC",
+        "SELECT id, role, content FROM chat_messages WHERE session_id = ? ORDER BY created_at DESC, id DESC LIMIT 40",
+    ):
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", ("x",)).fetchall()
+        print(f"  {sql}\n    " + "; ".join(row[-1] for row in plan))
+    conn.close()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
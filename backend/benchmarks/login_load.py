@@ -0,0 +1,147 @@
+"""
+Benchmark login throughput against chat-path latency under mixed load.
+
+Starts the API with uvicorn on a throwaway database (or targets --url), then
+runs two phases of --duration seconds each:
+
+  1. baseline: --chat-clients clients loop over authenticated session reads
+  2. mixed:    the same chat clients plus --login-clients clients hammering
+               POST /api/auth/login
+
+and reports chat p50/p95/p99 latency in both phases alongside login
+throughput and how many logins were shed with 429.
+
+Usage (from backend/):
+    python -m benchmarks.login_load --login-clients 32 --chat-clients 8
+"""
+import os
+import sys
+import time
+import uuid
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import Counter
+from typing import List
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = "benchmark-password"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port: int) -> subprocess.Popen:
+    """Run the API in a subprocess so client load doesn't share its event loop."""
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "benchmark")
+    env["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/login_bench.db"
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env
+    )
+
+
+async def wait_until_ready(client: httpx.AsyncClient, timeout: float = 60, path: str = "/") -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(path)).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.25)
+    raise RuntimeError("server did not start")
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return float("nan")
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+async def chat_client(client: httpx.AsyncClient, headers: dict, session_id: str, stop: float, latencies: List[float]):
+    while time.monotonic() < stop:
+        started = time.perf_counter()
+        response = await client.get(f"/api/sessions/{session_id}", params={"limit": 20}, headers=headers)
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - started) * 1000)
+
+
+async def login_client(client: httpx.AsyncClient, email: str, stop: float, statuses: Counter):
+    while time.monotonic() < stop:
+        response = await client.post("/api/auth/login", json={"email": email, "password": PASSWORD})
+        statuses[response.status_code] += 1
+        if response.status_code == 429:
+            await asyncio.sleep(float(response.headers.get("retry-after", "1")))
+
+
+async def run_phase(client, headers, session_id, email, args, with_logins: bool):
+    stop = time.monotonic() + args.duration
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    tasks = [chat_client(client, headers, session_id, stop, latencies) for _ in range(args.chat_clients)]
+    if with_logins:
+        tasks += [login_client(client, email, stop, statuses) for _ in range(args.login_clients)]
+    await asyncio.gather(*tasks)
+    return latencies, statuses
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Target a running server instead of starting one")
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--chat-clients", type=int, default=8)
+    parser.add_argument("--login-clients", type=int, default=32)
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if not url:
+        port = free_port()
+        server = start_server(port)
+        url = f"http://127.0.0.1:{port}"
+
+    limits = httpx.Limits(max_connections=args.chat_clients + args.login_clients + 4)
+    try:
+        async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+            await wait_until_ready(client)
+
+            email = f"bench-{uuid.uuid4().hex[:8]}@example.com"
+            signup = await client.post("/api/auth/signup", json={"email": email, "username": "bench", "password": PASSWORD})
+            signup.raise_for_status()
+            headers = {"Authorization": f"Bearer {signup.json()['access_token']}"}
+            session_id = (await client.post("/api/sessions", json={"title": "bench"}, headers=headers)).json()["id"]
+
+            baseline, _ = await run_phase(client, headers, session_id, email, args, with_logins=False)
+            mixed, statuses = await run_phase(client, headers, session_id, email, args, with_logins=True)
+            stats = (await client.get("/api/stats")).json().get("auth_pool", {})
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    print(f"\n{'chat requests':<22}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, samples in (("baseline", baseline), ("with login load", mixed)):
+        print(f"{name:<22}{len(samples):>8}{percentile(samples, 50):>10.1f}"
+              f"{percentile(samples, 95):>10.1f}{percentile(samples, 99):>10.1f}")
+
+    print(f"\nlogins: {statuses[200] / args.duration:.1f}/s succeeded, "
+          f"{statuses[429]} shed with 429, other statuses: "
+          f"{ {k: v for k, v in statuses.items() if k not in (200, 429)} or 'none'}")
+    if stats:
+        print(f"auth pool: {stats['workers']} workers, avg wait {stats['avg_wait_ms']} ms, "
+              f"avg hash {stats['avg_exec_ms']} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
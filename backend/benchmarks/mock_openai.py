@@ -0,0 +1,150 @@
+"""
+Local stand-in for the OpenAI chat-completions API, for load tests that
+shouldn't cost money or depend on OpenAI's latency.
+
+Serves POST /v1/chat/completions with:
+  - latency drawn from a log-normal distribution (--latency-ms is the
+    median, --latency-sigma its spread; 0 gives a fixed delay)
+  - streaming (SSE chunks, one per --token-ms, plus the usage chunk when
+    stream_options.include_usage is set)
+  - usage counts: prompt tokens estimated from the message text,
+    completion tokens from --completion-tokens (capped by max_tokens)
+
+Router classification prompts get a valid category (picked from the query
+so every specialist sees traffic) and everything else gets filler text.
+
+Point the API at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+
+Usage (from backend/):
+    python -m benchmarks.mock_openai --port 8100 --latency-ms 400 --latency-sigma 0.4
+"""
+import json
+import time
+import uuid
+import zlib
+import random
+import asyncio
+import argparse
+from typing import List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CATEGORIES = ["general", "coding", "grammar", "research", "planning", "creative", "math", "conversation"]
+FILLER = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor".split()
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def reply_for(messages: List[dict], completion_tokens: int) -> List[str]:
+    """Completion text as a list of token-sized pieces."""
+    system = messages[0].get("content", "") if messages else ""
+    query = messages[-1].get("content", "") if messages else ""
+    if "query classifier" in system:
+        return [CATEGORIES[zlib.crc32(query.encode()) % len(CATEGORIES)]]
+    if "title" in system.lower():
+        return ["Benchmark", " Session"]
+    return [(" " if i else "") + FILLER[i % len(FILLER)] for i in range(completion_tokens)]
+
+
+def create_app(latency_ms: float = 400, latency_sigma: float = 0.4, token_ms: float = 5,
+               completion_tokens: int = 120) -> FastAPI:
+    app = FastAPI(title="Mock OpenAI")
+    stats = {"requests": 0, "streamed": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    def latency() -> float:
+        if latency_sigma <= 0:
+            return latency_ms / 1000
+        return random.lognormvariate(0, latency_sigma) * latency_ms / 1000
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        model = body.get("model", "gpt-4o-mini")
+        limit = body.get("max_tokens") or completion_tokens
+        pieces = reply_for(messages, min(completion_tokens, limit))
+        usage = {
+            "prompt_tokens": sum(estimate_tokens(str(m.get("content", ""))) for m in messages),
+            "completion_tokens": len(pieces),
+            "prompt_tokens_details": {"cached_tokens": 0}
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        stats["requests"] += 1
+        stats["prompt_tokens"] += usage["prompt_tokens"]
+        stats["completion_tokens"] += usage["completion_tokens"]
+
+        if not body.get("stream"):
+            # Non-streamed answers arrive all at once, after generation would have finished
+            await asyncio.sleep(latency() + len(pieces) * token_ms / 1000)
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(pieces)},
+                    "finish_reason": "stop"
+                }],
+                "usage": usage
+            })
+
+        stats["streamed"] += 1
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        def chunk(delta: dict, finish_reason=None, chunk_usage=None, choices=True) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if choices else [],
+            }
+            if chunk_usage is not None:
+                payload["usage"] = chunk_usage
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def events():
+            await asyncio.sleep(latency())
+            yield chunk({"role": "assistant", "content": ""})
+            for piece in pieces:
+                yield chunk({"content": piece})
+                await asyncio.sleep(token_ms / 1000)
+            yield chunk({}, finish_reason="stop")
+            if include_usage:
+                yield chunk({}, chunk_usage=usage, choices=False)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=400, help="Median time to first token")
+    parser.add_argument("--latency-sigma", type=float, default=0.4, help="Log-normal spread (0 = fixed)")
+    parser.add_argument("--token-ms", type=float, default=5, help="Delay per generated token")
+    parser.add_argument("--completion-tokens", type=int, default=120)
+    args = parser.parse_args()
+
+    app = create_app(args.latency_ms, args.latency_sigma, args.token_ms, args.completion_tokens)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
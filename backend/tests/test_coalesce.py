@@ -0,0 +1,72 @@
+import asyncio
+
+from app.agents.coalesce import SingleFlight
+from app.services.llm_gateway import BACKGROUND, llm_priority
+
+
+def test_join_during_cancel_starts_a_new_run():
+    """A query arriving while the last waiter's run is being cancelled must not inherit the cancellation."""
+    async def scenario():
+        flights = SingleFlight()
+        runs = []
+
+        async def answer():
+            runs.append(len(runs))
+            await asyncio.sleep(0.05)
+            return f"run {len(runs)}"
+
+        first = asyncio.create_task(flights.run("math", "what is 2 + 2", answer))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        # Let the first caller leave (cancelling its flight) but not the flight's done callback
+        await asyncio.sleep(0)
+        second = asyncio.create_task(flights.run("math", "what is 2 + 2", answer))
+
+        result = await second
+        assert first.cancelled()
+        assert not second.cancelled()
+        assert result == "run 2"
+        assert len(runs) == 2
+
+    asyncio.run(scenario())
+
+
+def test_identical_queries_share_one_run():
+    async def scenario():
+        flights = SingleFlight()
+        runs = []
+
+        async def answer():
+            runs.append(1)
+            await asyncio.sleep(0.01)
+            return "4"
+
+        results = await asyncio.gather(*[flights.run("math", "what is 2 + 2", answer) for _ in range(3)])
+        assert results == ["4", "4", "4"]
+        assert len(runs) == 1
+        assert flights.flights == {}
+
+    asyncio.run(scenario())
+
+
+def test_interactive_query_does_not_join_background_run():
+    async def scenario():
+        flights = SingleFlight()
+        priorities = []
+
+        async def answer():
+            priorities.append(llm_priority.get())
+            await asyncio.sleep(0.01)
+            return "4"
+
+        async def background_run():
+            llm_priority.set(BACKGROUND)
+            return await flights.run("math", "what is 2 + 2", answer)
+
+        await asyncio.gather(
+            asyncio.create_task(background_run()),
+            flights.run("math", "what is 2 + 2", answer)
+        )
+        assert sorted(priorities) == [0, BACKGROUND]
+
+    asyncio.run(scenario())
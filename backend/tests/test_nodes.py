@@ -0,0 +1,36 @@
+import asyncio
+
+import pytest
+
+from app.agents.nodes import gather_llm
+from app.services.llm_gateway import LLMTimeoutError
+
+
+def test_gather_llm_cancels_siblings_when_one_call_fails():
+    async def scenario():
+        sibling_cancelled = asyncio.Event()
+
+        async def failing_call():
+            await asyncio.sleep(0.01)
+            raise LLMTimeoutError("too slow")
+
+        async def slow_call():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                sibling_cancelled.set()
+                raise
+
+        with pytest.raises(LLMTimeoutError):
+            await gather_llm(failing_call(), slow_call())
+        await asyncio.wait_for(sibling_cancelled.wait(), 1)
+
+    asyncio.run(scenario())
+
+
+def test_gather_llm_returns_results_in_order():
+    async def call(value, delay):
+        await asyncio.sleep(delay)
+        return value
+
+    assert asyncio.run(gather_llm(call("plan", 0.02), call("answer", 0))) == ["plan", "answer"]
@@ -0,0 +1,58 @@
+import asyncio
+import base64
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.database import Base, create_engine_from_url
+from app.models import ChatMessage
+from app.services.chat import decode_cursor, encode_cursor, get_session_messages, record_turn
+
+
+def test_cursor_round_trip():
+    message = ChatMessage(id="m-1", created_at=datetime(2024, 5, 1, 12, 30, 15, 123456))
+    assert decode_cursor(encode_cursor(message)) == (message.created_at, "m-1")
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor",
+    base64.urlsafe_b64encode(b"no separator").decode(),
+    base64.urlsafe_b64encode(b"yesterday|m-1").decode(),
+    base64.urlsafe_b64encode(b"\xff\xfe|m-1").decode()
+])
+def test_bad_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as excinfo:
+        decode_cursor(cursor)
+    assert excinfo.value.status_code == 400
+
+
+def test_pages_walk_back_through_the_session(tmp_path):
+    async def scenario():
+        engine = create_engine_from_url(f"sqlite:///{tmp_path}/chat.db")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        sessions = async_sessionmaker(engine, expire_on_commit=False)
+
+        async with sessions() as db:
+            await record_turn(db, "user-1", "s-1", "question 0", "answer 0", new_session_title="Test")
+            for i in range(1, 4):
+                await record_turn(db, "user-1", "s-1", f"question {i}", f"answer {i}")
+
+            everything, cursor = await get_session_messages(db, "s-1")
+            assert cursor is None
+            assert len(everything) == 8
+
+            pages, before = [], None
+            while True:
+                page, before = await get_session_messages(db, "s-1", limit=3, before=before)
+                pages.insert(0, [message.content for message in page])
+                if before is None:
+                    break
+        await engine.dispose()
+
+        assert [len(page) for page in pages] == [2, 3, 3]
+        assert sum(pages, []) == [message.content for message in everything]
+
+    asyncio.run(scenario())
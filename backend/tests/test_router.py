@@ -0,0 +1,70 @@
+import asyncio
+
+from app.agents import graph, nodes
+from app.agents.cache import MemoryCacheBackend, ResponseCache
+from app.agents.coalesce import SingleFlight
+from app.services.llm_gateway import LLMTimeoutError
+
+QUERY = "tell me something about my situation"
+
+
+def fresh_state(query=QUERY):
+    return {"query": query, "history": [], "route_fallback": False}
+
+
+def test_router_falls_back_to_general_without_caching(monkeypatch):
+    async def failing_llm(*args, **kwargs):
+        raise LLMTimeoutError("router timed out")
+
+    cache = ResponseCache(MemoryCacheBackend())
+    monkeypatch.setattr(graph, "response_cache", cache)
+    monkeypatch.setattr(nodes, "classify_query", lambda query: None)
+    monkeypatch.setattr(nodes, "call_llm", failing_llm)
+    router = graph.with_response_cache("router", nodes.router_agent)
+
+    state = asyncio.run(router(fresh_state()))
+    assert state["query_type"] == "general"
+    assert state["selected_agent"] == "general"
+    assert state["route_fallback"] is True
+    assert len(cache.backend) == 0
+
+
+def test_router_caches_a_real_classification(monkeypatch):
+    async def classifying_llm(*args, **kwargs):
+        return "Math"
+
+    cache = ResponseCache(MemoryCacheBackend())
+    monkeypatch.setattr(graph, "response_cache", cache)
+    monkeypatch.setattr(nodes, "classify_query", lambda query: None)
+    monkeypatch.setattr(nodes, "call_llm", classifying_llm)
+    router = graph.with_response_cache("router", nodes.router_agent)
+
+    state = asyncio.run(router(fresh_state()))
+    assert state["query_type"] == "math"
+    assert not state["route_fallback"]
+    assert asyncio.run(cache.get("router", QUERY)) == {"query_type": "math", "selected_agent": "math"}
+
+
+def test_shared_fallback_is_not_reused_by_joiners(monkeypatch):
+    async def scenario():
+        calls = []
+
+        async def flaky_llm(*args, **kwargs):
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            if len(calls) == 1:
+                raise LLMTimeoutError("router timed out")
+            return "math"
+
+        monkeypatch.setattr(nodes, "classify_query", lambda query: None)
+        monkeypatch.setattr(nodes, "call_llm", flaky_llm)
+        monkeypatch.setattr(graph, "single_flight", SingleFlight())
+        router = graph.with_single_flight("router", nodes.router_agent)
+
+        first, second = await asyncio.gather(router(fresh_state()), router(fresh_state()))
+        assert (first["query_type"], first["route_fallback"]) == ("general", True)
+        # The joiner routed the query itself instead of taking the guess
+        assert (second["query_type"], second["route_fallback"]) == ("math", False)
+        assert len(calls) == 2
+
+    asyncio.run(scenario())
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from app.services.llm_gateway import BACKGROUND, INTERACTIVE, LLMOverloadedError, LLMScheduler, TokenBucket
+
+
+def test_interactive_waiters_start_before_background_ones():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, rpm=0, tpm=0, max_queue=10, background_share=1)
+        started = []
+
+        async def call(name, priority):
+            await scheduler.acquire(10, priority)
+            started.append(name)
+            await asyncio.sleep(0)
+            scheduler.release(priority)
+
+        await scheduler.acquire(10, INTERACTIVE)
+        tasks = [
+            asyncio.create_task(call("background 1", BACKGROUND)),
+            asyncio.create_task(call("background 2", BACKGROUND)),
+            asyncio.create_task(call("interactive 1", INTERACTIVE)),
+            asyncio.create_task(call("interactive 2", INTERACTIVE))
+        ]
+        await asyncio.sleep(0)
+        assert len(scheduler.waiters) == 4
+
+        scheduler.release(INTERACTIVE)
+        await asyncio.gather(*tasks)
+        # Interactive calls jump the queue; within a priority it's first come, first served
+        assert started == ["interactive 1", "interactive 2", "background 1", "background 2"]
+        assert scheduler.in_flight == {INTERACTIVE: 0, BACKGROUND: 0}
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_sheds_calls():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, rpm=0, tpm=0, max_queue=1)
+        await scheduler.acquire(10)
+        waiting = asyncio.create_task(scheduler.acquire(10))
+        await asyncio.sleep(0)
+
+        with pytest.raises(LLMOverloadedError):
+            await scheduler.acquire(10)
+        assert scheduler.shed == 1
+
+        scheduler.release(INTERACTIVE)
+        await waiting
+
+    asyncio.run(scenario())
+
+
+def test_token_bucket_refills_over_time():
+    bucket = TokenBucket(60)  # one unit per second
+    bucket.take(60)
+    assert bucket.wait_time(1) == pytest.approx(1, abs=0.05)
+
+    # Pretend 30 seconds have passed
+    bucket.updated -= 30
+    assert bucket.wait_time(1) == 0
+    assert bucket.level == pytest.approx(30, abs=0.05)
+
+    # Refill stops at capacity, and larger requests wait for a full bucket
+    bucket.updated -= 3600
+    assert bucket.wait_time(1000) == 0
+    assert bucket.level == 60
+
+
+def test_token_bucket_refunds_and_unlimited():
+    bucket = TokenBucket(60)
+    bucket.take(80)  # usage can overshoot the estimate
+    assert bucket.wait_time(10) == pytest.approx(30, abs=0.05)
+    bucket.take(-20)  # reconciled with the reported usage
+    assert bucket.wait_time(10) == pytest.approx(10, abs=0.05)
+
+    unlimited = TokenBucket(0)
+    unlimited.take(10 ** 6)
+    assert unlimited.wait_time(10 ** 6) == 0
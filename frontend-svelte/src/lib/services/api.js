@@ -91,8 +91,14 @@ export async function fetchSessions() {
   return response.json();
 }
 
-export async function fetchSession(sessionId) {
-  const response = await fetch(`${API_BASE_URL}/api/sessions/${sessionId}`, {
+export async function fetchSession(sessionId, { limit, before } = {}) {
+  // Without a limit the whole session is returned; with one, pass next_cursor back as `before` for older pages
+  const params = new URLSearchParams();
+  if (limit) params.set('limit', limit);
+  if (before) params.set('before', before);
+  const query = params.toString() ? `?${params}` : '';
+
+  const response = await fetch(`${API_BASE_URL}/api/sessions/${sessionId}${query}`, {
     headers: getAuthHeaders()
   });
 
@@ -156,6 +162,28 @@ export async function deleteSession(sessionId) {
 
 // ============== Chat API ==============
 
+// New sessions get a provisional title; the AI-generated one is saved after
+// the answer is returned, so poll with backoff (about 20s in all) until it changes.
+// Clients of /api/ask/text/stream get it as the final "title" event instead.
+const TITLE_RETRY_DELAYS = [1000, 2000, 3000, 5000, 9000];
+
+async function refreshSessionTitle(sessionId, provisionalTitle) {
+  for (const delay of TITLE_RETRY_DELAYS) {
+    await new Promise(resolve => setTimeout(resolve, delay));
+    if (!get(token)) return; // Signed out meanwhile
+    try {
+      // limit=1 keeps the response small; only the session's title is needed
+      const session = await fetchSession(sessionId, { limit: 1 });
+      if (session.title !== provisionalTitle) {
+        updateSessionInList(sessionId, { title: session.title });
+        return;
+      }
+    } catch (err) {
+      // Keep the provisional title and try again
+    }
+  }
+}
+
 export async function askText(queryText) {
   try {
     error.set(null);
@@ -212,6 +240,9 @@ export async function askText(queryText) {
           updated_at: new Date().toISOString()
         });
         currentSessionId.set(data.session_id);
+        if (data.title_pending) {
+          refreshSessionTitle(data.session_id, title);
+        }
       }
 
       // Add messages to current session view
@@ -292,6 +323,9 @@ export async function askVoice(audioBlob, extension = '.webm') {
           updated_at: new Date().toISOString()
         });
         currentSessionId.set(data.session_id);
+        if (data.title_pending) {
+          refreshSessionTitle(data.session_id, title);
+        }
       }
 
       addMessagePair(data.question, data.answer, {
@@ -314,8 +348,20 @@ export async function askVoice(audioBlob, extension = '.webm') {
   }
 }
 
+// Server cache locations of already synthesized clips, so replays skip synthesis
+const ttsLocations = new Map();
+
 export async function textToSpeech(text) {
   try {
+    const cachedLocation = ttsLocations.get(text);
+    if (cachedLocation) {
+      const audio = new Audio(`${API_BASE_URL}${cachedLocation}`);
+      // The clip may have been evicted; synthesize again next time
+      audio.onerror = () => ttsLocations.delete(text);
+      audio.play();
+      return audio;
+    }
+
     const response = await fetch(`${API_BASE_URL}/api/tts`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
@@ -326,6 +372,11 @@ export async function textToSpeech(text) {
       throw new Error('Failed to generate speech');
     }
 
+    const location = response.headers.get('Content-Location');
+    if (location) {
+      ttsLocations.set(text, location);
+    }
+
     const audioBlob = await response.blob();
     const audioUrl = URL.createObjectURL(audioBlob);
     const audio = new Audio(audioUrl);